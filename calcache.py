@@ -0,0 +1,170 @@
+#!/usr/bin/python
+
+# Local on-disk store of calendar events for printcal, so a run only has to
+# go back to Google for the days that have gone stale.
+
+import calendar
+import calevent
+from datetime import *
+from dateutil.tz import *
+import os
+import sqlite3
+import threading
+import time
+
+class CalendarCache:
+    """SQLite store of calendar events, keyed by event id and indexed by
+       the local date each event starts on.  Each day remembers when it
+       was last synced; get_range() serves fresh days from disk and only
+       refetches the stale ones."""
+
+    def __init__(self, path='~/.printcal-calendar.db', maxage=60*60,
+                 offline=False):
+        """Accepts path to the database file, maxage as the number of
+           seconds a synced day stays fresh, and offline (if True, never
+           fetch; just print what's in the cache)."""
+        self.path = os.path.expanduser(path)
+        self.maxage = maxage
+        self.offline = offline
+        self.stats = dict(hits=0, misses=0, refreshes=0, refresh_time=0.0,
+                          changed=0, offline=0)
+        # iter_calendar fetches from a background thread, so share one
+        # connection between threads and take turns on it
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        # gdata hands us utf-8 strs; keep them that way on the way back out
+        self.db.text_factory = str
+        columns = [i[1] for i in self.db.execute('PRAGMA table_info(events)')]
+        if 'xml' in columns:
+            # an old cache of whole gdata entries: start over
+            self.db.executescript('''
+                DROP TABLE events;
+                DROP TABLE IF EXISTS days;
+            ''')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS events (
+                id TEXT PRIMARY KEY,
+                day TEXT NOT NULL,
+                start REAL NOT NULL,
+                finish REAL,
+                allday INTEGER NOT NULL,
+                updated TEXT,
+                title TEXT NOT NULL,
+                location TEXT NOT NULL,
+                content TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS events_day ON events (day);
+            CREATE TABLE IF NOT EXISTS days (
+                day TEXT PRIMARY KEY,
+                fetched REAL NOT NULL);
+        ''')
+        self.db.commit()
+
+    def get_range(self, start, end, fetch):
+        """Returns {date: [events]} for [start, end), like
+           printcal.get_cal_by_range.  fetch(start, end) is called to get
+           the same thing from the server for whichever part of the range
+           is stale; if it fails, the cached copy is served instead."""
+        days = [start.date() + timedelta(days=i)
+                for i in xrange((end.date() - start.date()).days)]
+        if not days:
+            return {}
+        with self.lock:
+            stale = self.stale_days(days, self.maxage)
+
+        if stale and not self.offline:
+            self.stats['misses'] += 1
+            fetchstart = start + timedelta(days=(stale[0] - start.date()).days)
+            fetchend = start + timedelta(days=(stale[-1] - start.date()).days + 1)
+            began = time.time()
+            try:
+                fresh = fetch(fetchstart, fetchend)
+            except Exception:
+                with self.lock:
+                    known = len(self.stale_days(days, maxage=None)) < len(days)
+                if not known:
+                    raise
+                self.stats['offline'] += 1
+            else:
+                with self.lock:
+                    self.store(stale[0], stale[-1], fresh)
+                self.stats['refreshes'] += 1
+                self.stats['refresh_time'] += time.time() - began
+        elif stale:
+            self.stats['offline'] += 1
+        else:
+            self.stats['hits'] += 1
+
+        out = {}
+        local = tzlocal()
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT day, start, finish, allday, id, updated, title, '
+                'location, content FROM events WHERE day >= ? AND day < ? '
+                'ORDER BY start', (str(days[0]), str(days[-1] + timedelta(days=1))))
+            for (day, begins, finish, allday, eventid, updated, title,
+                 location, content) in rows:
+                day = datetime.strptime(day, '%Y-%m-%d').date()
+                if finish is not None:
+                    finish = datetime.fromtimestamp(finish, local)
+                event = calevent.Event(datetime.fromtimestamp(begins, local),
+                                       finish, title=title, location=location,
+                                       allday=bool(allday), id=eventid,
+                                       updated=updated, content=content)
+                out.setdefault(day, []).append(event)
+        return out
+
+    def report(self):
+        """A one-line summary of the stats"""
+        return ('calcache: %(hits)i hits, %(misses)i misses, %(refreshes)i '
+                'refreshes in %(refresh_time).2fs, %(changed)i events '
+                'changed, %(offline)i served offline' % self.stats)
+
+    def stale_days(self, days, maxage):
+        """Which of days need fetching: never synced, or synced more than
+           maxage seconds ago (None: any sync will do)."""
+        fetched = dict(self.db.execute(
+            'SELECT day, fetched FROM days WHERE day >= ? AND day <= ?',
+            (str(days[0]), str(days[-1]))))
+        now = time.time()
+        return [i for i in days if str(i) not in fetched
+                or (maxage is not None and fetched[str(i)] + maxage < now)]
+
+    def store(self, first, last, fresh):
+        """Sync the days first..last with fresh ({date: [calevent.Event]}):
+           only new or changed events are written, vanished ones are
+           dropped."""
+        known = dict(self.db.execute(
+            'SELECT id, updated FROM events WHERE day >= ? AND day <= ?',
+            (str(first), str(last))))
+        seen = set()
+        for day, events in fresh.items():
+            if day < first or day > last:
+                continue
+            for event in events:
+                seen.add(event.id)
+                if event.id in known and known[event.id] == event.updated:
+                    continue
+                finish = None
+                if event.end is not None:
+                    finish = calendar.timegm(event.end.utctimetuple())
+                self.db.execute(
+                    'INSERT OR REPLACE INTO events (id, day, start, finish, '
+                    'allday, updated, title, location, content) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (event.id, str(day),
+                     calendar.timegm(event.start.utctimetuple()), finish,
+                     int(event.allday), event.updated, event.title,
+                     event.location, event.content))
+                self.stats['changed'] += 1
+        for eventid in set(known) - seen:
+            self.db.execute('DELETE FROM events WHERE id = ?', (eventid,))
+        now = time.time()
+        day = first
+        while day <= last:
+            self.db.execute('INSERT OR REPLACE INTO days (day, fetched) '
+                            'VALUES (?, ?)', (str(day), now))
+            day += timedelta(days=1)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,53 @@
+#!/usr/bin/python
+
+# Calendar events as printcal uses them: just the fields that get printed,
+# parsed once when they're fetched, without the gdata XML trees behind them.
+
+from datetime import *
+from dateutil.tz import *
+from dateutil.parser import *
+
+class Event(object):
+    """One calendar event.  start and end are aware local datetimes (end
+       is None if the event didn't have one); allday is True for events
+       given as dates rather than times."""
+
+    __slots__ = ('start', 'end', 'title', 'location', 'allday', 'id',
+                 'updated', 'content')
+
+    def __init__(self, start, end=None, title='', location='', allday=False,
+                 id=None, updated=None, content=''):
+        self.start = start
+        self.end = end
+        self.title = title
+        self.location = location
+        self.allday = allday
+        self.id = id
+        self.updated = updated
+        self.content = content
+
+    def __repr__(self):
+        return '<Event %s %r>' % (self.start, self.title)
+
+def from_entry(entry, default):
+    """Makes an Event out of a gdata CalendarEventEntry.  default is the
+       datetime to fill in missing bits of its times from (midnight at the
+       start of the range being fetched, usually)."""
+    when = entry.when[0]
+    start = parse(when.start_time, default=default).astimezone(tzlocal())
+    end = None
+    if when.end_time:
+        end = parse(when.end_time, default=default).astimezone(tzlocal())
+
+    location = ''
+    if getattr(entry, 'where', None) and entry.where[0].value_string:
+        location = entry.where[0].value_string
+    content = ''
+    if getattr(entry, 'content', None) and entry.content.text:
+        content = entry.content.text.strip()
+
+    return Event(start, end, title=entry.title.text or '', location=location,
+                 allday=len(when.start_time) <= len('YYYY-MM-DD'),
+                 id=entry.id.text,
+                 updated=entry.updated and entry.updated.text,
+                 content=content)
@@ -0,0 +1,179 @@
+#!/usr/bin/python
+
+# Page layout for printcal: fits blocks of lines (a day's schedule, the
+# overdue list...) onto fixed-size pages as they're produced, so the caller
+# can stop producing them as soon as nothing more will fit.
+
+# block priorities, most important first
+TODAY = 0
+OVERDUE = 1
+FUTURE = 2
+FILLER = 3
+
+class Block:
+    """A run of lines that belong together, followed by gap blank lines.
+       A divisible block may be cut short to fit; the others go on the
+       page whole or not at all."""
+
+    def __init__(self, lines, priority=FUTURE, divisible=False, gap=1):
+        self.lines = lines
+        self.priority = priority
+        self.divisible = divisible
+        self.gap = gap
+
+    def size(self):
+        return len(self.lines) + self.gap
+
+    def cut(self, size):
+        """Shortens the block to size lines (gap included), the last of
+           them saying how many were left out.  Returns how many lines
+           were lost."""
+        keep = size - self.gap - 1
+        left = len(self.lines) - keep
+        self.lines = self.lines[:keep] + ['(%i more not shown)' % left]
+        return left
+
+class PageLayout:
+    """Lays blocks out on up to maxpages pages of maxlength lines, each
+       ending with footer.  Blocks are placed in the order they arrive;
+       one that doesn't fit can take the room of less important blocks
+       already on the page, cutting divisible ones short before dropping
+       anything whole.  The lines at the fold points are padded with dots
+       so they're easy to line up."""
+
+    def __init__(self, maxlength=63, maxwidth=78, footer=[], folds=[],
+                 maxpages=1):
+        self.maxlength = maxlength
+        self.maxwidth = maxwidth
+        self.footer = footer
+        self.folds = folds
+        self.maxpages = maxpages
+        self.pages = [[]]
+        self.stats = dict(placed=0, cut=0, dropped=0, unused=0)
+        # lines taken by the days (TODAY and FUTURE blocks) so far
+        self.days = 0
+        self.daylines = 0
+
+    def pagelength(self):
+        """Lines on a page, less the footer"""
+        return self.maxlength - len(self.footer)
+
+    def remaining(self):
+        """Free lines left on the current page"""
+        return self.pagelength() - sum(i.size() for i in self.pages[-1])
+
+    def full(self):
+        """True once nothing more will fit, on this page or a new one"""
+        return self.remaining() <= 0 and len(self.pages) >= self.maxpages
+
+    def days_left(self, guess=8):
+        """About how many more days will fit, counting any pages still to
+           come, going by how long the days so far have been (guess lines
+           each until there's been one)"""
+        if self.days:
+            guess = float(self.daylines) / self.days
+        free = self.remaining() + (self.maxpages - len(self.pages)) * self.pagelength()
+        return max(0, int(free / max(guess, 1)))
+
+    def add(self, lines, priority=FUTURE, divisible=False, gap=1):
+        """Places lines as one block; returns False if they didn't make
+           it onto any page."""
+        block = Block(list(lines), priority, divisible, gap)
+        if (block.size() > self.remaining() and self.pages[-1]
+                and len(self.pages) < self.maxpages
+                and (divisible or block.size() <= self.pagelength())):
+            self.pages.append([])
+        if priority in (TODAY, FUTURE):
+            self.days += 1
+            self.daylines += block.size()
+        if self.make_room(block):
+            self.pages[-1].append(block)
+            self.stats['placed'] += 1
+            return True
+        if divisible and self.remaining() >= gap + 2:
+            self.stats['unused'] += block.cut(self.remaining())
+            self.pages[-1].append(block)
+            self.stats['placed'] += 1
+            self.stats['cut'] += 1
+            return True
+        self.stats['dropped'] += 1
+        self.stats['unused'] += len(block.lines)
+        return False
+
+    def make_room(self, block):
+        """Makes room for block on the current page by cutting or
+           dropping less important blocks; returns False (having touched
+           nothing) if it can't be done."""
+        needed = block.size() - self.remaining()
+        if needed <= 0:
+            return True
+
+        # least important first, and the latest of those first
+        page = self.pages[-1]
+        victims = sorted([i for i in page if i.priority > block.priority],
+                         key=lambda i: (-i.priority, -page.index(i)))
+        plan = []
+        for i in victims:
+            if needed <= 0:
+                break
+            if i.divisible and i.size() - needed >= i.gap + 2:
+                plan.append((i, i.size() - needed))
+                needed = 0
+            else:
+                plan.append((i, 0))
+                needed -= i.size()
+        if needed > 0:
+            return False
+
+        for i, size in plan:
+            if size:
+                self.stats['unused'] += i.cut(size)
+                self.stats['cut'] += 1
+            else:
+                page.remove(i)
+                self.stats['placed'] -= 1
+                self.stats['dropped'] += 1
+                self.stats['unused'] += len(i.lines)
+        return True
+
+    def stream(self, header, rows, priority=FILLER):
+        """Fills the rest of the current page with header and then as
+           many of rows as fit, pulling them from the iterator one at a
+           time.  Returns how many rows were placed."""
+        if self.remaining() < len(header) + 2:
+            return 0
+        block = Block(list(header), priority, divisible=True, gap=0)
+        self.pages[-1].append(block)
+        self.stats['placed'] += 1
+        rows = iter(rows)
+        count = 0
+        while self.remaining() > 0:
+            try:
+                block.lines.append(rows.next())
+            except StopIteration:
+                break
+            count += 1
+        return count
+
+    def report(self):
+        """A one-line summary of what did and didn't fit"""
+        return ('layout: %(placed)i blocks placed, %(cut)i cut short, '
+                '%(dropped)i dropped, %(unused)i lines unused' % self.stats)
+
+    def lines(self):
+        """Returns every page as one list of lines; each page after the
+           first starts with a form feed."""
+        out = []
+        for number, page in enumerate(self.pages):
+            body = []
+            for block in page:
+                body.extend(block.lines)
+                body.extend([''] * block.gap)
+            for fold in self.folds:
+                if fold < len(body):
+                    body[fold] = str('{0:.<%i}' % self.maxwidth).format(body[fold])
+            body.extend(self.footer)
+            if number > 0:
+                body[0] = '\f' + body[0]
+            out.extend(body)
+        return out
@@ -0,0 +1,42 @@
+#!/usr/bin/python
+
+# Deferred imports, so printcal and todo.py only pay for the heavy modules
+# (cups, gcalcli, pycurl, yaml...) on the code paths that actually use them.
+
+import importlib
+
+class LazyModule:
+    """Stands in for a module, importing it the first time one of its
+       attributes is looked up.  If given several names, the first one
+       that imports is used."""
+
+    def __init__(self, *names):
+        self.__dict__['_names'] = names
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            for name in self._names:
+                try:
+                    module = importlib.import_module(name)
+                    break
+                except ImportError:
+                    if name == self._names[-1]:
+                        raise
+            self.__dict__['_module'] = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        if self._module is None:
+            return '<lazy module %s>' % '|'.join(self._names)
+        return repr(self._module)
+
+def lazy_import(*names):
+    """Returns a LazyModule for the first of names that imports"""
+    return LazyModule(*names)
@@ -1,91 +1,224 @@
 #!/usr/bin/python
 
+import collections
 import datetime
+import re
+import threading
 import time
 import weather
 
 daysofweek = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 
-def getweather(city='Rochester',state='NY'):
+# NWS product header, e.g. "400 PM EDT MON JUL 6 2009"
+issuedre = re.compile(r'^(\d{3,4}) (AM|PM) \w+ \w{3} (\w{3}) +(\d{1,2}) (\d{4})\s*$', re.M)
+
+def get_issued(text):
+    """Returns when a forecast was issued, as a timestamp, or None"""
+    match = issuedre.search(text)
+    if not match:
+        return None
+    hhmm, ampm, month, day, year = match.groups()
+    try:
+        return time.mktime(time.strptime('%s %s %s %s %s' % (
+            hhmm.zfill(4), ampm, month.title(), day, year), '%I%M %p %b %d %Y'))
+    except ValueError:
+        return None
+
+def fetch_forecast(city, state):
+    """Returns the forecast text for city, state, or None if we can't
+       get it"""
+    try:
+        return weather.get_forecast(city, state)
+    except (SystemExit, Exception):
+        return None
+
+def parse_forecast(text, fetched=None):
+    """Parses text into a forecast entry.  Its day offsets are counted
+       from parsedon, the day it was issued (or fetched, if we can't
+       tell), since that's the day its "Tonight" and weekdays mean."""
+    issued = get_issued(text)
+    fetched = fetched or time.time()
+    parsedon = datetime.date.fromtimestamp(issued or fetched)
+    return {'text': text, 'issued': issued, 'fetched': fetched,
+            'parsedon': parsedon,
+            'forecast': parseweather(text, today=parsedon)}
+
+def store_forecast(cache, key, text, maxage, fetched=None):
+    """Parses text and puts it in cache under key; returns the entry"""
+    entry = parse_forecast(text, fetched)
+    cache.set(key, entry, ttl=maxage)
+    return entry
+
+def current_forecast(entry, today=None):
+    """Returns entry's forecast with the day offsets counted from today
+       (a date; default: today) rather than the day it was parsed
+       against; the days that have already gone are left out."""
+    if today is None:
+        today = datetime.date.today()
+    elapsed = (today - entry['parsedon']).days
+    if elapsed <= 0:
+        return entry['forecast']
+    return dict((offset - elapsed, day)
+                for offset, day in entry['forecast'].items()
+                if offset >= elapsed)
+
+# the cache keys being refreshed right now, so there's one fetch at a time
+refreshing = set()
+refreshing_lock = threading.Lock()
+
+def refresh_forecast(cache, key, city, state, maxage):
+    """Fetch a new forecast into the cache, keeping the old one if the
+       fetch fails"""
     try:
-        forecast = weather.get_forecast(city, state).split('\n')
-    except SystemExit:
-        return {}
+        text = fetch_forecast(city, state)
+        if text:
+            store_forecast(cache, key, text, maxage)
+    finally:
+        with refreshing_lock:
+            refreshing.discard(key)
+
+def start_refresh(cache, key, city, state, maxage):
+    """Starts refresh_forecast in the background, unless it's already
+       running for key"""
+    with refreshing_lock:
+        if key in refreshing:
+            return
+        refreshing.add(key)
+    # not a daemon thread, so the refresh lands in the cache for next
+    # time even if we've finished printing by then
+    threading.Thread(target=refresh_forecast,
+                     args=(cache, key, city, state, maxage)).start()
 
+def getweather(city='Rochester',state='NY',cache=None,refresh=6*60*60,
+               minrefresh=30*60,maxage=7*24*60*60):
+    """Returns {dayoffset: DayForecast} for city, state.  Accepts cache
+       as a printcache.Cache (or anything with get and set) to keep
+       forecasts in: a cached forecast is used as-is, and refreshed in the
+       background once it's refresh seconds past its issuance time (but
+       no sooner than minrefresh seconds after it was fetched), one fetch
+       at a time.  If the weather can't be fetched, the last good forecast
+       (up to maxage seconds old) is used instead."""
+    if cache is None:
+        text = fetch_forecast(city, state)
+        if not text:
+            return {}
+        return current_forecast(parse_forecast(text))
+
+    key = 'weather/%s/%s' % (city, state)
+    entry = cache.get(key)
+    if entry is None:
+        text = fetch_forecast(city, state)
+        if not text:
+            return {}
+        entry = store_forecast(cache, key, text, maxage)
+    else:
+        now = time.time()
+        due = max((entry['issued'] or entry['fetched']) + refresh,
+                  entry['fetched'] + minrefresh)
+        if now > due:
+            start_refresh(cache, key, city, state, maxage)
+    # the keys are day offsets, so they move on at midnight
+    return current_forecast(entry)
+
+# a forecast period: "Monday... Sunny. High 80." (or ".MONDAY...SUNNY"),
+# with any continuation lines up to the next period or blank line
+periodre = re.compile(r'^[ \t]*\.?([A-Za-z]+)(?: [A-Za-z]+)?[ \t]*\.\.\.[ \t]*'
+                      r'(.*(?:\n(?![ \t]*\.?[A-Za-z]+(?: [A-Za-z]+)?[ \t]*\.\.\.)'
+                      r'[ \t]*\S.*)*)', re.M)
+# the end of the first zone's forecasts
+zonere = re.compile(r'^[ \t]*\$\$', re.M)
+# the interesting bits of a period's (lower-cased) text: a high or a low and
+# the first number after it in the same sentence, and any chance of rain
+tempre = re.compile(r'\b(high|low)s?\b[^\d.]*?(-?\d+)')
+popre = re.compile(r'(\d+) ?(?:%|percent)')
+dayindex = dict((name, i) for i, name in enumerate(daysofweek))
+
+# one day's forecast; fields we don't know are None
+DayForecast = collections.namedtuple('DayForecast', 'high low pop day night')
+
+def split_periods(text):
+    """Returns [(dayname, text)] for each period in the first zone of a
+       forecast; continuation lines are joined on, and anything after the
+       first $$ (the forecasts for other zones) is ignored."""
+    if '$$' in text:
+        zone = zonere.search(text)
+        if zone:
+            text = text[:zone.start()]
+    periods = []
+    for dayname, periodtext in periodre.findall(text):
+        if '\n' in periodtext:
+            periodtext = ' '.join(i.strip() for i in periodtext.split('\n'))
+        periods.append((dayname.title(), periodtext.rstrip()))
+    return periods
+
+def scan_period(text):
+    """Returns (high, low, pop, conditions) from one period's text"""
+    lower = text.lower()
+    high = low = pop = None
+    for kind, temp in tempre.findall(lower):
+        if kind == 'high':
+            high = int(temp)
+        else:
+            low = int(temp)
+    if '%' in lower or 'percent' in lower:
+        for i in popre.findall(lower):
+            pop = max(pop, int(i))
+    # the conditions are everything up to the first comma, as they always were
+    conditions = text.split(',', 1)[0].strip()
+    if not conditions or conditions.split(' ', 1)[0].lower() in ('high', 'low'):
+        conditions = None
+    return high, low, pop, conditions
+
+def parseweather(text, today=None):
+    """Turns forecast text into the dictionary getweather returns.  Days
+       are counted from today (a date; default: today).
+
+       A period with both a high and a low is a whole day.  Otherwise
+       it's half of one, and waits (in carry) for its other half; a lone
+       high at the end of the forecast stands on its own, as does a lone
+       low for tonight."""
+    if today is None:
+        today = datetime.date.today()
+
+    weekday = today.weekday()
     forecastdict = {}
+    carry = None # (dayoffset, DayForecast) waiting for its other half
+
+    for dayname, periodtext in split_periods(text):
+        if dayname not in dayindex:
+            continue
+        dayoffset = (dayindex[dayname] - weekday) % 7
+        high, low, pop, conditions = scan_period(periodtext)
+        day = night = None
+        if high is not None:
+            day = conditions
+        if low is not None:
+            night = conditions
+
+        if high is not None and low is not None:
+            forecastdict[dayoffset] = DayForecast(high, low, pop, day, night)
+        elif high is not None:
+            if carry and carry[1].low is not None:
+                forecastdict[dayoffset] = DayForecast(
+                    high, carry[1].low, max(pop, carry[1].pop), day,
+                    carry[1].night)
+                carry = None
+            else:
+                carry = (dayoffset, DayForecast(high, None, pop, day, None))
+        elif low is not None:
+            if carry and carry[1].high is not None:
+                forecastdict[dayoffset] = DayForecast(
+                    carry[1].high, low, max(pop, carry[1].pop),
+                    carry[1].day, night)
+                carry = None
+            elif dayoffset == 0:
+                forecastdict[dayoffset] = DayForecast(None, low, pop, None, night)
+            else:
+                carry = (dayoffset, DayForecast(None, low, pop, None, night))
 
-    today = time.localtime()[6]
-
-    lowtempcarry = False
-    hightempcarry = False
-    popcarry = False
-    dayconditionscarry = False
-    nightconditionscarry = False
-    
-    for i in forecast:
-        firstword = i.strip().split(' ')[0].strip('.')
-        if firstword in daysofweek:
-            forecastdayindex = daysofweek.index(firstword)
-            dayoffset = forecastdayindex - today
-            if dayoffset < 0:
-                # damn sundays
-                dayoffset += 7
-            forecastdatetime = datetime.date.today() + datetime.timedelta(dayoffset)
-            hightempnext = lowtempnext = False
-            hightemp = lowtemp = pop = False
-            dayconditions = nightconditions = False
-            conditions = i.strip().split('...')[1].split(',')[0].strip()
-            if conditions.split(' ')[0] in ['high', 'High', 'low', 'Low']:
-                conditions = False
-            for j in i.strip().split(' '):
-                if hightempnext:
-                    hightempnext = False
-                    hightemp = int(j.strip(',.'))
-                elif lowtempnext:
-                    lowtempnext = False
-                    lowtemp = int(j.strip(',.'))
-                elif j in ['high', 'High']:
-                    hightempnext = True
-                    dayconditions = conditions
-                elif j in ['low', 'Low']:
-                    lowtempnext = True
-                    nightconditions = conditions
-                elif j[-1] == '%':
-                    pop = int(j[:-1])
-
-            if hightemp and lowtemp:
-                forecastdict[dayoffset] = (hightemp, lowtemp, pop, dayconditions, nightconditions)
-            elif hightemp and lowtempcarry:
-                if popcarry:
-                    pop = max(pop, popcarry)
-                if nightconditionscarry:
-                    nightconditions = nightconditionscarry
-                    nightconditionscarry = False
-                forecastdict[dayoffset] = (hightemp, lowtempcarry, pop, dayconditions, nightconditions)
-                lowtempcarry = False
-            elif lowtemp and hightempcarry:
-                if popcarry:
-                    pop = max(pop, popcarry)
-                if dayconditionscarry:
-                    dayconditions = dayconditionscarry
-                    dayconditionscarry = False
-                forecastdict[dayoffset] = (hightempcarry, lowtemp, pop, dayconditions, nightconditions)
-                hightempcarry = False
-            elif lowtemp:
-                if dayoffset == 0:
-                    forecastdict[dayoffset] = (False, lowtemp, pop, False, nightconditions)
-                else:
-                    lowtempcarry = lowtemp
-                    popcarry = pop
-                    nightconditionscarry = nightconditions
-            elif hightemp:
-                hightempcarry = hightemp
-                dayconditionscarry = dayconditions
-                popcarry = pop
-    if hightempcarry:
-        # handle the "last day" of the forecast, which seems
-        # to only show a high temp.  experimental
-        forecastdict[dayoffset] = (hightempcarry, False, False, dayconditionscarry, nightconditions)
+    if carry and carry[1].high is not None:
+        # the "last day" of the forecast seems to only show a high temp
+        forecastdict[carry[0]] = carry[1]._replace(pop=None)
 
     return forecastdict
 
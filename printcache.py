@@ -0,0 +1,143 @@
+#!/usr/bin/python
+
+# Shared on-disk cache for printcal's data sources: per-entry TTLs, a size
+# bound with least-recently-used eviction, and SQLite transactions so a crash
+# mid-write never leaves a half-written entry behind.
+
+import cPickle
+import os
+import sqlite3
+import threading
+import time
+
+class Cache:
+    """Persistent key/value cache.  Values are pickled; every entry has
+       its own expiry time and a last-used time, both indexed, so expiring
+       and evicting only touch the rows involved rather than the whole
+       cache."""
+
+    def __init__(self, path='/tmp/printcalcache.db', ttl=15*24*60*60,
+                 maxentries=10000):
+        """Accepts path to the database file, ttl as the default lifetime
+           of an entry in seconds, and maxentries as the most entries to
+           keep (None: no limit)."""
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.maxentries = maxentries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        with self.db:
+            self.db.executescript('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires REAL NOT NULL,
+                    used REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);
+                CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+                CREATE TABLE IF NOT EXISTS meta (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL);
+                INSERT OR IGNORE INTO meta (name, value) VALUES ('count', 0);
+                CREATE TRIGGER IF NOT EXISTS entries_added
+                    AFTER INSERT ON entries BEGIN
+                    UPDATE meta SET value = value + 1 WHERE name = 'count';
+                    END;
+                CREATE TRIGGER IF NOT EXISTS entries_removed
+                    AFTER DELETE ON entries BEGIN
+                    UPDATE meta SET value = value - 1 WHERE name = 'count';
+                    END;
+            ''')
+        self.expire()
+
+    def get(self, key, default=None):
+        """Returns the value stored under key, or default if there isn't
+           one or it has expired."""
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                'SELECT value FROM entries WHERE key = ? AND expires >= ?',
+                (key, now)).fetchone()
+            if row is None:
+                return default
+            with self.db:
+                self.db.execute('UPDATE entries SET used = ? WHERE key = ?',
+                                (now, key))
+        return cPickle.loads(str(row[0]))
+
+    def set(self, key, value, ttl=None):
+        """Stores value under key for ttl seconds (default: self.ttl)."""
+        if ttl is None:
+            ttl = self.ttl
+        now = time.time()
+        blob = sqlite3.Binary(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+        with self.lock:
+            with self.db:
+                # delete-then-insert rather than REPLACE, so the count
+                # triggers see both halves
+                self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self.db.execute(
+                    'INSERT INTO entries (key, value, expires, used) '
+                    'VALUES (?, ?, ?, ?)', (key, blob, now + ttl, now))
+                self.evict()
+
+    def update(self, items, ttl=None):
+        """Stores every (key, value) of the dict items in one transaction."""
+        if ttl is None:
+            ttl = self.ttl
+        now = time.time()
+        rows = [(key, sqlite3.Binary(cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)),
+                 now + ttl, now) for key, value in items.items()]
+        with self.lock:
+            with self.db:
+                self.db.executemany('DELETE FROM entries WHERE key = ?',
+                                    [row[:1] for row in rows])
+                self.db.executemany(
+                    'INSERT INTO entries (key, value, expires, used) '
+                    'VALUES (?, ?, ?, ?)', rows)
+                self.evict()
+
+    def delete(self, key):
+        with self.lock:
+            with self.db:
+                self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def expire(self):
+        """Drops every expired entry."""
+        with self.lock:
+            with self.db:
+                self.db.execute('DELETE FROM entries WHERE expires < ?',
+                                (time.time(),))
+
+    def evict(self):
+        """Drops least recently used entries until there are no more than
+           maxentries.  Call with the lock held, inside a transaction."""
+        if self.maxentries is None:
+            return
+        extra = len(self) - self.maxentries
+        if extra > 0:
+            self.db.execute(
+                'DELETE FROM entries WHERE key IN '
+                '(SELECT key FROM entries ORDER BY used LIMIT ?)', (extra,))
+
+    def __len__(self):
+        return self.db.execute(
+            "SELECT value FROM meta WHERE name = 'count'").fetchone()[0]
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        self.delete(key)
+
+    def close(self):
+        self.db.close()
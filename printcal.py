@@ -3,62 +3,287 @@
 # Script based off of gcalcli to print a daily schedule from the calendar
 # Ryan Tucker <rtucker@gmail.com>
 
-import cups
 from datetime import *
 from dateutil.tz import *
 from dateutil.parser import *
-import gcalcli
-import miniweather
+from lazyimport import lazy_import
+import itertools
+import layout
 import os
+import Queue
 import random
 import re
-import shelve
 import string
 import sys
-import tempfile
 import textwrap
+import threading
 import time
 
-# build translation ascii table
-asciitable = string.maketrans(''.join(chr(a) for a in xrange(127,256)), '?'*129)
+# these are only imported once something is looked up on them, so e.g.
+# console mode never loads cups, and asking the daemon loads none of them
+calcache = lazy_import('calcache')
+calevent = lazy_import('calevent')
+ConfigParser = lazy_import('ConfigParser')
+cups = lazy_import('cups')
+gcalcli = lazy_import('gcalcli')
+miniweather = lazy_import('miniweather')
+printcache = lazy_import('printcache')
+printjob = lazy_import('printjob')
+psrender = lazy_import('psrender')
+socket = lazy_import('socket')
+SocketServer = lazy_import('SocketServer')
+todo = lazy_import('todo')
 
-def get_cal_by_day(gcal, date=datetime.now(tzlocal()).replace(hour=0, minute=0,
-                   second=0, microsecond=0)):
-    """Returns a gcalcli eventlist for a given date.  Requires a
-       gcalcli.GoogleCalendar instance (gcal), accepts datetime object (date)
+def midnight():
+    """Returns today at 00:00, local time.  Use this rather than a default
+       argument, which would be frozen at import time."""
+    return datetime.now(tzlocal()).replace(hour=0, minute=0, second=0,
+                                           microsecond=0)
+
+# translation ascii table, built the first time it's needed
+asciitable = None
+
+# the footer's random cookies, from next to this script
+default_cookiefile = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'oblique_strategies.txt')
+
+def to_ascii(line):
+    """Replaces anything outside of 7-bit ascii in line with ?"""
+    global asciitable
+    if isinstance(line, unicode):
+        return line.encode('ascii', 'replace')
+    if asciitable is None:
+        asciitable = string.maketrans(''.join(chr(a) for a in xrange(127,256)), '?'*129)
+    return line.translate(asciitable)
+
+class Prefetch(threading.Thread):
+    """Runs func(*args) in a background thread.  result() waits for it to
+       finish and returns its value (or raises whatever it raised)."""
+
+    def __init__(self, func, *args):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.func = func
+        self.args = args
+        self.value = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.value = self.func(*self.args)
+        except Exception:
+            self.error = sys.exc_info()
+
+    def result(self):
+        self.join()
+        if self.error:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.value
+
+class Feed(threading.Thread):
+    """Runs a day-at-a-time source iterator on its own thread, up to depth
+       days ahead of whoever is reading it with next().  Accepts wanted as
+       a function returning about how many more days the reader can use;
+       the feed won't read further ahead than that.  close() stops the
+       thread once the reader is done with it."""
+
+    def __init__(self, name, source, timeout=30, depth=2, wanted=None):
+        threading.Thread.__init__(self, name=name)
+        self.setDaemon(True)
+        self.source = source
+        self.timeout = timeout
+        self.depth = depth
+        self.wanted = wanted
+        self.queue = Queue.Queue()
+        self.turn = threading.Condition()
+        self.asked = 0      # index of the next day we'll hand out
+        self.failed = False
+        self.done = False
+        self.stopped = False
+        self.start()
+
+    def run(self):
+        index = 0
+        source = iter(self.source)
+        try:
+            while True:
+                self.wait_turn(index)
+                if self.stopped:
+                    break
+                try:
+                    value = source.next()
+                except StopIteration:
+                    break
+                self.queue.put((index, value, False))
+                index += 1
+        except Exception:
+            self.queue.put((index, None, True))
+        else:
+            self.queue.put((index, StopIteration, False))
+        finally:
+            # let the source tidy up (and drop any fetch it had pending)
+            if hasattr(source, 'close'):
+                source.close()
+
+    def close(self):
+        """Stops reading the source; the thread exits as soon as whatever
+           it's waiting on comes back"""
+        with self.turn:
+            self.stopped = True
+            self.turn.notify()
+
+    def ahead(self):
+        """How many days past the reader's the source may be read"""
+        if self.wanted is None:
+            return self.depth
+        return min(self.depth, self.wanted())
+
+    def wait_turn(self, index):
+        """Blocks until day index is within reach of the reader"""
+        with self.turn:
+            while not self.stopped and index >= self.asked + self.ahead():
+                self.turn.wait()
+
+    def next(self):
+        """Returns the next day from the source, or None if it didn't
+           turn up within timeout seconds or the source has failed.
+           Raises StopIteration once the source has run out."""
+        with self.turn:
+            index = self.asked
+            self.asked += 1
+            self.turn.notify()
+        if self.done:
+            raise StopIteration
+        if self.failed:
+            return None
+        deadline = time.time() + self.timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            try:
+                got, value, failed = self.queue.get(True, remaining)
+            except Queue.Empty:
+                return None
+            if failed:
+                self.failed = True
+                return None
+            if value is StopIteration:
+                self.done = True
+                raise StopIteration
+            if got == index:
+                return value
+            # otherwise it's a late answer for a day we already gave up on
+
+def get_cal_by_range(gcal, start, end, cache=None):
+    """Returns a dictionary of calevent.Event lists for [start, end),
+       keyed by the local date each event starts on.  Requires a
+       gcalcli.GoogleCalendar instance (gcal) and datetimes start and end.
+       The whole range is fetched with one query.  Accepts cache as a
+       calcache.CalendarCache, in which case only stale days are fetched.
     """
-    out = []
-    for i in gcal._SearchForCalEvents(start=date, end=date+timedelta(days=1),
-                 defaultDateTime=date, searchText=None):
-        eventStartDateTime = parse(i.when[0].start_time, default=date).astimezone(tzlocal())
-        if eventStartDateTime.strftime('%j') == date.strftime('%j'):
-            out.append(i)
+    if cache is not None:
+        return cache.get_range(start, end,
+                               lambda s, e: get_cal_by_range(gcal, s, e))
+
+    out = {}
+    for i in gcal._SearchForCalEvents(start=start, end=end,
+                 defaultDateTime=start, searchText=None):
+        event = calevent.from_entry(i, default=start)
+        out.setdefault(event.start.date(), []).append(event)
     return out
 
-def iter_weather(city='Washington',state='DC'):
-    """Returns an iterator giving weather for today, tomorrow, and the
-       day after"""
-    weather = miniweather.getweather(city=city,state=state)
+def get_cal_by_day(gcal, date=None):
+    """Returns a list of calevent.Event for a given date.  Requires a
+       gcalcli.GoogleCalendar instance (gcal), accepts datetime object (date)
+    """
+    if date is None:
+        date = midnight()
+    return get_cal_by_range(gcal, date, date+timedelta(days=1)).get(date.date(), [])
+
+def iter_weather(city='Washington',state='DC',cache=None,start=None,
+                 end=None):
+    """Returns an iterator giving the weather (a miniweather.DayForecast)
+       for each day from start (default: today) until end or the end of
+       the forecast; a day the forecast leaves out is all None.  Accepts
+       cache as a printcache.Cache to keep the forecast in between runs."""
+    if start is None:
+        start = midnight()
 
-    for i in weather.keys():
-        yield weather[i]
+    weather = miniweather.getweather(city=city,state=state,cache=cache)
+    if not weather:
+        return
 
-def iter_calendar(gcal, start=datetime.now(tzlocal()).replace(hour=0, minute=0,
-                   second=0, microsecond=0),
-                  end=datetime.fromtimestamp(2**31-86400, tz=tzlocal())):
+    # the forecast is keyed by days from today
+    offset = (start.date() - date.today()).days
+    pointer = start
+    while offset <= max(weather.keys()) and (end is None or pointer < end):
+        yield weather.get(offset, miniweather.DayForecast(None, None, None,
+                                                          None, None))
+        offset += 1
+        pointer += timedelta(days=1)
+
+def next_chunk_days(days, count, target=20, mindays=1, maxdays=31):
+    """Sizes the next calendar fetch: given a chunk of days days that
+       held count events, returns how many days should hold about target
+       events, between mindays and maxdays."""
+    if count:
+        days = days * target / count
+    else:
+        days = days * 2
+    return max(mindays, min(maxdays, days))
+
+def iter_calendar(gcal, start=None,
+                  end=datetime.fromtimestamp(2**31-86400, tz=tzlocal()),
+                  chunkdays=1, target=20, cache=None, wanted=None):
     """Returns an iterator that spits out a day of calendar stuff per
        iteration.  Takes a gcalcli.GoogleCalendar instance as gcal.  Accepts
-       a datetime as start and end.  Defaults to today, and never."""
+       a datetime as start and end.  Defaults to today, and never.
+
+       Events are fetched in chunks, starting with chunkdays days; each
+       following chunk is sized to hold about target events, going by how
+       busy the last one was, and is fetched in the background while the
+       current one is being consumed.  Accepts cache as a
+       calcache.CalendarCache to read events through, and wanted as a
+       function returning about how many more days will be used: chunks
+       are kept within that, and nothing is read ahead past it."""
+
+    if start is None:
+        start = midnight()
+
+    def fetch(chunkstart, days):
+        if wanted is not None:
+            days = max(1, min(days, wanted()))
+        chunkend = min(chunkstart + timedelta(days=days), end)
+        return chunkend, Prefetch(get_cal_by_range, gcal, chunkstart,
+                                  chunkend, cache)
 
     pointer = start
+    days = chunkdays
+    chunkend, pending = fetch(start, days)
+    index = {}
+    indexend = start
 
     while pointer < end:
-        result = get_cal_by_day(gcal=gcal, date=pointer)
+        if pointer >= indexend:
+            if pending is None:
+                chunkend, pending = fetch(indexend, days)
+            index = pending.result()
+            pending = None
+            # round, since a DST change makes a "day" 23 or 25 hours
+            span = int(round((chunkend - indexend).total_seconds() / 86400.0)) or 1
+            days = next_chunk_days(span, sum(len(i) for i in index.values()),
+                                   target=target)
+            indexend = chunkend
+            if indexend < end and (wanted is None or wanted() > span):
+                # read ahead while our consumer works through this chunk
+                chunkend, pending = fetch(indexend, days)
+        result = index.get(pointer.date(), [])
         pointer += timedelta(days=1)
         yield result
 
-def iter_todo(path, start=datetime.now(tzlocal()).replace(hour=0, minute=0,
-                   second=0, microsecond=0),
+def iter_todo(path, start=None,
               end=datetime.fromtimestamp(2**31-86400, tz=tzlocal()),
               firstoverdue=False):
     """Returns an iterator that spits a day of to-do list stuff per
@@ -69,6 +294,9 @@ def iter_todo(path, start=datetime.now(tzlocal()).replace(hour=0, minute=0,
        (that is, overdue things.)
     """
 
+    if start is None:
+        start = midnight()
+
     pointer = start
 
     while pointer < end:
@@ -80,144 +308,263 @@ def iter_todo(path, start=datetime.now(tzlocal()).replace(hour=0, minute=0,
             pointer += timedelta(days=1)
 
         todolist = os.popen(path + ' --due %s list' % search).readlines()
-        if len(todolist) > 0:
-            # remove the first line, since it's boilerplate
-            out = []
-            for i in todolist[1:]:
-                line = re.sub(' \[.*\]$', '', i.strip())
-                if line.startswith('-'):
-                    out.append('   ' + line)
-                elif line.startswith('*'):
-                    out.append(' ' + line)
-                else:
-                    out.append(line)
-            yield out
+        yield clean_todo_lines(todolist)
+
+def clean_todo_lines(todolist):
+    """Takes the lines of a "todo.py list" run and tidies them up for the
+       page: drops the owner boilerplate and the trailing [tags]."""
+    if len(todolist) > 0:
+        # remove the first line, since it's boilerplate
+        out = []
+        for i in todolist[1:]:
+            line = re.sub(' \[.*\]$', '', i.strip())
+            if line.startswith('-'):
+                out.append('   ' + line)
+            elif line.startswith('*'):
+                out.append(' ' + line)
+            else:
+                out.append(line)
+        return out
+    else:
+        # empty list
+        return []
+
+def get_hm_talker(conffile=None, share=None):
+    """Returns a logged-in todo.hm_talker for in-process Hiveminder access.
+       Accepts conffile as a path to a .hiveminder file (default: ~), and
+       share as a pycurl.CurlShare to pool connections through."""
+    conf = todo.hm_config(conffile)
+    hm = todo.hm_talker(conf, share=share)
+    if not conf.configured() or not hm.do_login():
+        raise Exception('Hiveminder login failed; run todo.py --reconfig')
+    return hm
+
+def get_task_due(task):
+    """Returns the due date of a task as a date, or None"""
+    if not task.get('due'):
+        return None
+    return datetime.strptime(str(task['due'])[:10], '%Y-%m-%d').date()
+
+def iter_todo_hm(hm, start=None,
+                 end=datetime.fromtimestamp(2**31-86400, tz=tzlocal()),
+                 firstoverdue=False):
+    """Like iter_todo, but talks to Hiveminder in-process through a
+       todo.hm_talker (hm) instead of running todo.py once per day.  The
+       whole due-date range, overdue stuff included, comes back from a
+       single DownloadTasks query and is split up by day here.
+    """
+
+    if start is None:
+        start = midnight()
+
+    query = 'not/complete/starts/before/tomorrow/accepted/but_first/nothing'
+    query += '/owner/me/due/before/%s' % end.strftime('%Y-%m-%d')
+    if not firstoverdue:
+        query += '/due/after/%s' % (start - timedelta(days=1)).strftime('%Y-%m-%d')
+
+    overdue = []
+    byday = {}
+    for task in hm.download_tasks(query):
+        due = get_task_due(task)
+        if due is None:
+            continue
+        if due < start.date():
+            overdue.append(task)
         else:
-            # empty list
-            yield []
-
-def iter_random_todo(path):
-    """Returns iterator of random, no-due-date todo list items"""
-
-    # cache is a dict:  {'taskid': (todoitem object, timestamp)}
-    cache = shelve.open('/tmp/printcalcache.shelve', writeback=True)
-    # expire stuff
-    for i in cache.keys():
-        item, ts = cache[i]
-        if ts+(15*24*60*60) < time.time():
-            # more than 15 days old; purge.
-            del cache[i]
-
-    todoids = os.popen(path + ' --due after/forever --task-ids-only').readlines()
+            byday.setdefault(due, []).append(task)
+
+    if firstoverdue:
+        yield clean_todo_lines(todo.format_task_list(overdue))
+
+    pointer = start
+
+    while pointer < end:
+        tasks = byday.get(pointer.date(), [])
+        pointer += timedelta(days=1)
+        yield clean_todo_lines(todo.format_task_list(tasks))
+
+def iter_random_todo(path=None, hm=None, cache=None):
+    """Returns iterator of random, no-due-date todo list items.  Takes
+       either a path to todo.py or a todo.hm_talker as hm; with hm, every
+       undated task is hydrated from one DownloadTasks call instead of a
+       todo.py listid run per task.  Accepts cache as a printcache.Cache
+       (default: /tmp/printcalcache.db)."""
+
+    if cache is None:
+        cache = printcache.Cache()
+
+    items = {}
+    if hm:
+        # no need to go back to the cache, which may have evicted them
+        items = hydrate_random_todo(hm, cache)
+        todoids = items.keys()
+    else:
+        todoids = os.popen(path + ' --due after/forever --task-ids-only').readlines()
     if len(todoids) > 0:
         random.shuffle(todoids)
         for i in todoids:
-            if i in cache:
-                todoitem, ts = cache[i]
-            else: 
+            todoitem = items.get(i) or cache.get(i)
+            if todoitem is None:
                 todoitem = os.popen(path + ' listid ' + i).readlines()[2]
-                cache[i] = (todoitem, time.time())
+                cache.set(i, todoitem, ttl=15*24*60*60)
 
             line = re.sub(' \[.*\]$', '', todoitem.strip())
             if line.startswith('*'):
                 yield line
 
-def iter_days(gcal, start=datetime.now(tzlocal()).replace(hour=0, minute=0,
-              second=0, microsecond=0),
+def hydrate_random_todo(hm, cache):
+    """Fetches every undated task through hm (a todo.hm_talker) in one
+       round trip and stores its list line in cache, the same way
+       iter_random_todo does for todo.py listid.  Returns the lines, by
+       task id."""
+    query = 'not/complete/starts/before/tomorrow/accepted/but_first/nothing'
+    query += '/owner/me/due/after/forever'
+    items = {}
+    for task in hm.download_tasks(query):
+        # keyed like the --task-ids-only lines, so both paths share a cache
+        items[todo.encode_locator(task['id']) + '\n'] = todo.format_task_line(task)
+    cache.update(items, ttl=15*24*60*60)
+    return items
+
+def iter_days(gcal=None, start=None,
               end=datetime.fromtimestamp(2**31-86400, tz=tzlocal()),
-              firstoverdue=False, weather=('Rochester', 'NY'), path=None):
+              firstoverdue=False, weather=('Rochester', 'NY'), path=None,
+              hm=None, calcache=None, cache=None, timeouts={}, sources=None,
+              wanted=None):
     """Returns an iterator producing a daily dictionary of useful data,
-       including 'calendar', 'todo', 'weather'.
-       Requires gcalcli.GoogleCalendar instance as gcal, accepts path as
-       a path to todo.py or todo.pl (default: no todo list), accepts start
-       and end as datetimes (assumes today and never), accepts firstoverdue
-       (if True, the first run returns only a 'todo' with things due before
-       today), and accepts weather as a tuple of (City, State)."""
-
-    cal = iter_calendar(gcal, start=start, end=end)
-    if path:
-        todo = iter_todo(path=path, start=start, end=end,
-                         firstoverdue=firstoverdue)
-    else:
-        todo = None
-    wx = iter_weather(city=weather[0], state=weather[1])
+       keyed by source name: 'calendar', 'todo', 'weather' by default.
+       Accepts sources as a list of Source instances; otherwise they're
+       made by default_sources() from gcal (a gcalcli.GoogleCalendar),
+       path (to todo.py or todo.pl) or hm (a todo.hm_talker), weather (a
+       tuple of (City, State)), calcache (a calcache.CalendarCache) and
+       cache (a printcache.Cache).  Accepts start and end as datetimes
+       (assumes today and never), accepts firstoverdue (if True, the first
+       run returns only a 'todo' with things due before today), and
+       accepts timeouts as a dictionary of how many seconds to wait on
+       each source for each day, overriding the source's own timeout.
+       The sources are all fetched at once; one that misses its timeout
+       shows up as None for that day.  Accepts wanted as a function
+       returning about how many more days will be used, which is handed
+       to the sources so they don't fetch days that won't be printed."""
+
+    if start is None:
+        start = midnight()
+
+    if sources is None:
+        sources = default_sources(gcal, firstoverdue=firstoverdue,
+                                  weather=weather, path=path, hm=hm,
+                                  calcache=calcache, cache=cache)
+
+    # start them all at once, each on its own thread
+    feeds = []
+    for i in sources:
+        i.wanted = wanted
+        feeds.append(Feed(i.name, i.timed_fetch(start, end),
+                          timeout=timeouts.get(i.name, i.timeout),
+                          wanted=wanted))
+    todo = [i for i in feeds if i.name == 'todo']
 
     counter = 0
     pointer = start
 
-    while True:
-        if firstoverdue:
-            firstoverdue = False
-            yield {'day': -1, 'todo': todo.next()}
-        
-        outdict = {'day': counter, 'datetime': pointer}
+    # the feeds' threads go when we do, even if we're not run to the end
+    try:
+        while True:
+            if firstoverdue:
+                firstoverdue = False
+                yield {'day': -1, 'todo': todo[0].next()}
+
+            outdict = {'day': counter, 'datetime': pointer}
 
-        for i in [cal, todo, wx]:
-            if i:
+            for i in feeds:
                 try:
-                    name = i.gi_code.co_name.split('_')[1]
-                    result = i.next()
-                    outdict[name] = result
+                    # None here means the source was too slow, or broken
+                    outdict[i.name] = i.next()
                 except StopIteration:
                     pass
 
-        counter += 1
-        pointer += timedelta(days=1)
+            counter += 1
+            pointer += timedelta(days=1)
 
-        if pointer > end:
-            return
-        else:
-            yield outdict
+            if pointer > end:
+                return
+            else:
+                yield outdict
+    finally:
+        for i in feeds:
+            i.close()
 
-def format_day_text(daydict, order=['weather', 'calendar', 'todo']):
+# where the usual sections go on the sheet; any others come after them
+default_order = ['weather', 'calendar', 'todo']
+
+def section_order(names):
+    """Returns names (of sources) in the order their sections are printed:
+       the usual ones first, then the rest as given"""
+    names = list(names)
+    return ([i for i in default_order if i in names] +
+            [i for i in names if i not in default_order])
+
+def format_day_text(daydict, order=None, formatters=None):
     """Formats a dictionary containing daystuff into a pretty block of
     text.  Requires daydict (the dictionary of day stuff), accepts
-    order (a list of keys, in order of output preference)."""
+    order (a list of keys, in order of output preference; default: every
+    key there's a formatter for, by section_order) and formatters (a
+    dictionary of functions by key, each turning that key's value into a
+    list of lines; default: those of the registered sources)."""
+
+    if formatters is None:
+        formatters = default_formatters
+    if order is None:
+        order = section_order(sorted(formatters))
 
     out = []
     if daydict.has_key('datetime'):
         out.append(daydict['datetime'].strftime('%A, %B %d (Day %j, week %W)'))
 
     for i in order:
-        if daydict.has_key(i):
-            tmp = eval('format_day_sub_%s(daydict["%s"])' % (i, i))
+        if daydict.has_key(i) and daydict[i] is None:
+            out.append('(%s not available)' % i)
+        elif daydict.has_key(i):
+            tmp = formatters[i](daydict[i])
             if daydict['day'] < 0 and i is 'todo' and len(tmp) > 0:
                 out.append('*** OVERDUE TODO LIST ITEMS ***')
             out.extend(tmp)
 
     return out
 
-def get_timestring(eventtime):
-    """Take an event.when time and return a good-looking formatted time"""
-    eventDateTime = parse(eventtime,
-        default=datetime.now(tzlocal()).replace(hour=0, minute=0,
-        second=0, microsecond=0)).astimezone(tzlocal())
-    meridiem = eventDateTime.strftime('%p').lower()
-    return eventDateTime.strftime('%l:%M') + meridiem
+# rendered times of day, by (hour, minute)
+timestrings = {}
+
+def format_time(when):
+    """Returns a datetime's time of day, the way the sheet shows it"""
+    key = (when.hour, when.minute)
+    if key not in timestrings:
+        timestrings[key] = when.strftime('%l:%M') + when.strftime('%p').lower()
+    return timestrings[key]
 
 def format_day_sub_calendar(row):
-    """Formats a list of CalendarEventEntry objects into a list of pretty
+    """Formats a list of calevent.Event objects into a list of pretty
     output strings."""
 
     out = []
 
     for event in row:
-        startTimeStr = get_timestring(event.when[0].start_time)
-        endTimeStr = get_timestring(event.when[0].end_time)
+        startTimeStr = format_time(event.start)
+        endTimeStr = format_time(event.end or event.start)
 
-        if event.where[0].value_string:
-            location = ' (%s)' % event.where[0].value_string
+        if event.location:
+            location = ' (%s)' % event.location
         else:
             location = ''
 
-        if startTimeStr == endTimeStr == '12:00am':
-            out.append('All day: %s' % (event.title.text + location))
+        if event.allday or startTimeStr == endTimeStr == '12:00am':
+            out.append('All day: %s' % (event.title + location))
         elif startTimeStr == endTimeStr:
             out.append('        %-7s  %s' % (startTimeStr,
-                                             event.title.text + location))
+                                             event.title + location))
         else:
             out.append('%-7s-%-7s  %s' % (startTimeStr, endTimeStr,
-                                          event.title.text + location))
+                                          event.title + location))
 
     return out
 
@@ -226,7 +573,7 @@ def format_day_sub_todo(row):
     return row
 
 def format_day_sub_weather(row):
-    """Pretties up the weather."""
+    """Pretties up the weather (a miniweather.DayForecast)."""
     (hightemp, lowtemp, pop, dayconditions, nightconditions) = row
     output = []
     if dayconditions:
@@ -242,44 +589,236 @@ def format_day_sub_weather(row):
 
     return [', '.join(output)]
 
-def iter_text_days(gcal, start=datetime.now(tzlocal()).replace(hour=0,
-                               minute=0, second=0, microsecond=0),
+class Source:
+    """One section of the daily sheet.  Subclasses set name (the key it
+       goes under in the day dictionary) and provide fetch(start, end),
+       returning an iterator with one value per day from start, and either
+       formatter (a function, as a staticmethod) or format(value), turning
+       one day's value into a list of lines.  Register them with
+       register_source() to make them available by name; a registered
+       formatter is also what format_day_text uses by default.  Each
+       instance keeps its own timings.
+
+       iter_days sets wanted to a function returning about how many more
+       days the page has room for; a source that can fetch less should
+       look at it."""
+
+    name = None
+    timeout = 30    # seconds to wait for each day
+    wanted = None
+    formatter = None
+
+    def __init__(self):
+        self.timings = {'fetch': 0.0, 'format': 0.0, 'days': 0, 'used': 0}
+
+    def fetch(self, start, end):
+        raise NotImplementedError
+
+    def format(self, value):
+        if self.formatter:
+            return self.formatter(value)
+        return value
+
+    def timed_fetch(self, start, end):
+        """Like fetch, but counts the time spent waiting on each day"""
+        began = time.time()
+        for value in self.fetch(start, end):
+            self.timings['fetch'] += time.time() - began
+            self.timings['days'] += 1
+            yield value
+            began = time.time()
+        self.timings['fetch'] += time.time() - began
+
+    def timed_format(self, value):
+        """Like format, but counts the time spent"""
+        began = time.time()
+        try:
+            return self.format(value)
+        finally:
+            self.timings['format'] += time.time() - began
+            self.timings['used'] += 1
+
+    def report(self):
+        """A one-line summary of the timings"""
+        return '%s: %i days (%i unused), fetch %.2fs, format %.2fs' % (
+            self.name, self.timings['days'],
+            self.timings['days'] - self.timings['used'],
+            self.timings['fetch'], self.timings['format'])
+
+class CalendarSource(Source):
+    """Calendar events from a gcalcli.GoogleCalendar"""
+    name = 'calendar'
+
+    def __init__(self, gcal, calcache=None):
+        Source.__init__(self)
+        self.gcal = gcal
+        self.calcache = calcache
+
+    def fetch(self, start, end):
+        return iter_calendar(self.gcal, start=start, end=end,
+                             cache=self.calcache, wanted=self.wanted)
+
+    formatter = staticmethod(format_day_sub_calendar)
+
+class TodoSource(Source):
+    """Todo list items by due date, from a todo.hm_talker (hm) or by
+       running todo.py (path)"""
+    name = 'todo'
+
+    def __init__(self, hm=None, path=None, firstoverdue=False):
+        Source.__init__(self)
+        self.hm = hm
+        self.path = path
+        self.firstoverdue = firstoverdue
+
+    def fetch(self, start, end):
+        if self.hm:
+            return iter_todo_hm(self.hm, start=start, end=end,
+                                firstoverdue=self.firstoverdue)
+        return iter_todo(path=self.path, start=start, end=end,
+                         firstoverdue=self.firstoverdue)
+
+    formatter = staticmethod(format_day_sub_todo)
+
+class WeatherSource(Source):
+    """The forecast for (city, state) from miniweather"""
+    name = 'weather'
+    timeout = 10
+
+    def __init__(self, city='Rochester', state='NY', cache=None):
+        Source.__init__(self)
+        self.city = city
+        self.state = state
+        self.cache = cache
+
+    def fetch(self, start, end):
+        return iter_weather(city=self.city, state=self.state,
+                            cache=self.cache, start=start, end=end)
+
+    formatter = staticmethod(format_day_sub_weather)
+
+# the known kinds of Source, by name
+source_types = {}
+
+# how format_day_text turns each kind of day value into lines, by default
+default_formatters = {}
+
+def register_source(cls):
+    """Makes a Source subclass available by its name, and its formatter
+       (if it has one) the default for its section"""
+    source_types[cls.name] = cls
+    if cls.formatter:
+        default_formatters[cls.name] = cls.formatter
+    return cls
+
+register_source(CalendarSource)
+register_source(TodoSource)
+register_source(WeatherSource)
+
+def make_source(name, *args, **kwargs):
+    """Returns a new instance of the Source registered as name"""
+    return source_types[name](*args, **kwargs)
+
+def default_sources(gcal, firstoverdue=False, weather=('Rochester', 'NY'),
+                    path=None, hm=None, calcache=None, cache=None):
+    """The usual calendar, todo (if there's hm or path) and weather
+       sources, from the arguments iter_days has always taken"""
+    sources = [make_source('calendar', gcal, calcache=calcache)]
+    if hm or path:
+        sources.append(make_source('todo', hm=hm, path=path,
+                                   firstoverdue=firstoverdue))
+    sources.append(make_source('weather', weather[0], weather[1],
+                               cache=cache))
+    return sources
+
+def sheet_sources(clients, weather=('Rochester', 'NY'), extra=()):
+    """The sources for a sheet: default_sources() from clients (as
+       returned by connect()), then the extra ones connect() was given and
+       those in extra.  Each extra source is a Source, or the name of a
+       registered one to make with no arguments."""
+    sources = default_sources(clients['gcal'], firstoverdue=True,
+                              hm=clients['hm'], weather=weather,
+                              calcache=clients['calcache'],
+                              cache=clients['cache'])
+    for i in list(clients.get('sources', ())) + list(extra):
+        if isinstance(i, basestring):
+            i = make_source(i)
+        sources.append(i)
+    return sources
+
+# TextWrappers, by width, so there's one per width rather than one per line
+wrappers = {}
+
+def get_wrapper(width):
+    """Returns a textwrap.TextWrapper for width columns"""
+    if width not in wrappers:
+        wrappers[width] = textwrap.TextWrapper(width)
+    return wrappers[width]
+
+def iter_text_days(gcal=None, start=None,
               end=datetime.fromtimestamp(2**31-86400, tz=tzlocal()),
               enddelta=None,
               firstoverdue=False, weather=('Rochester', 'NY'), path=None,
-              order=['weather', 'calendar', 'todo'], maxwidth=74):
+              hm=None, calcache=None, cache=None, sources=None,
+              order=None, maxwidth=74, wanted=None):
     """Yields a list of rows of length < maxwidth.  Arguments are the
-    union of iter_days and format_day_text, basically."""
+    union of iter_days and format_day_text, basically; order defaults to
+    the sources' names, by section_order."""
+
+    if start is None:
+        start = midnight()
 
     if enddelta:
         end = start+timedelta(days=enddelta)
 
-    iter = iter_days(gcal, start=start, end=end, firstoverdue=firstoverdue,
-                     weather=weather, path=path)
+    if sources is None:
+        sources = default_sources(gcal, firstoverdue=firstoverdue,
+                                  weather=weather, path=path, hm=hm,
+                                  calcache=calcache, cache=cache)
+    # work out who formats what once, not once a day
+    formatters = dict((i.name, i.timed_format) for i in sources)
+    if order is None:
+        order = section_order(i.name for i in sources)
 
-    for i in iter:
-        out = []
-        for j in format_day_text(i, order=order):
-            out.extend(textwrap.wrap(j, maxwidth))
-        yield out
+    iter = iter_days(start=start, end=end, firstoverdue=firstoverdue,
+                     sources=sources, wanted=wanted)
 
-def main():
-    cfg = gcalcli.LoadConfig('~/.gcalclirc')
+    wrapper = get_wrapper(maxwidth)
+
+    try:
+        for i in iter:
+            out = []
+            for j in format_day_text(i, order=order, formatters=formatters):
+                out.extend(wrapper.wrap(j))
+            yield out
+    finally:
+        iter.close()
+
+def connect(offline=False, gcalclirc='~/.gcalclirc', hiveminder=None,
+            calendardb='~/.printcal-calendar.db', share=None, cache=None,
+            sources=()):
+    """Logs in to Google Calendar and Hiveminder and opens the caches;
+       returns them all in a dictionary for render_sheet.  If offline,
+       the calendar is printed from its cache without fetching.  Accepts
+       the paths of the gcalcli and todo.py configs and of the calendar
+       cache, share as a pycurl.CurlShare for the Hiveminder connection,
+       cache as an already-open printcache.Cache, and sources as more
+       sections to print on every sheet (see sheet_sources)."""
+    cfg = gcalcli.LoadConfig(gcalclirc)
     usr = gcalcli.GetConfig(cfg, 'user', '')
     pwd = gcalcli.GetConfig(cfg, 'pw', '')
     access = gcalcli.GetConfig(cfg, 'cals', 'all')
     details = True
 
-    cookiefile = '/home/rtucker/dev/printcal/oblique_strategies.txt'
-    maxlength = 63
-    maxwidth = 78
-
-    gcal = gcalcli.GoogleCalendar(username=usr, password=pwd, access=access, details=details)
-
-    footer = ['']
-
-    cookie = random.sample(open(cookiefile, 'r').readlines(), 1)[0].strip()
+    return {'gcal': gcalcli.GoogleCalendar(username=usr, password=pwd,
+                                           access=access, details=details),
+            'hm': get_hm_talker(hiveminder, share=share),
+            'calcache': calcache.CalendarCache(calendardb, offline=offline),
+            'cache': cache or printcache.Cache(),
+            'sources': list(sources)}
 
+def stamp_line():
+    """The last line of the sheet, saying when and where it was printed"""
     todaydatetime = time.strftime('%m/%d at %H:%M')
 
     printcalrevdate = time.strftime('%Y.%m.%d.%H%M',
@@ -287,67 +826,385 @@ def main():
 
     myhostname = os.uname()[1].split('.')[0]
 
-    footer.extend(textwrap.wrap(cookie, maxwidth))
-    footer.append('Schedule printed %s: printcal (%s) on %s' % (
-               todaydatetime, printcalrevdate, myhostname))
+    return 'Schedule printed %s: printcal (%s) on %s' % (
+               todaydatetime, printcalrevdate, myhostname)
 
-    remaining = maxlength - len(footer)
-    out = []
+def lay_out_sheet(clients, cookiefile=default_cookiefile,
+                  maxlength=63, maxwidth=78, weather=('Rochester', 'NY'),
+                  timings=False, pages=1, sources=()):
+    """Returns a page of schedule as a layout.PageLayout.  Requires
+       clients, as returned by connect().  Accepts weather as a tuple of
+       (City, State), pages as how many pages the week may run to, and
+       sources as more sections to print (see sheet_sources).  If
+       timings, each source's timings are written to stderr."""
+    hm = clients['hm']
+    cache = clients['cache']
 
-    iter = iter_text_days(gcal, firstoverdue=True, maxwidth=maxwidth,
-                          enddelta=7,
-                          path='/home/rtucker/dev/printcal/todo.py')
+    footer = ['']
+
+    cookie = random.sample(open(cookiefile, 'r').readlines(), 1)[0].strip()
+
+    footer.extend(get_wrapper(maxwidth).wrap(cookie))
+    footer.append(stamp_line())
+
+    page = layout.PageLayout(maxlength, maxwidth, footer=footer,
+                             folds=[maxlength/3 - 2], maxpages=pages)
+
+    sources = sheet_sources(clients, weather=weather, extra=sources)
+    iter = iter_text_days(firstoverdue=True, maxwidth=maxwidth,
+                          enddelta=7, sources=sources,
+                          wanted=page.days_left)
 
-    while remaining > 0:
+    # the overdue list comes first, then today, then the days after
+    priorities = itertools.chain([layout.OVERDUE, layout.TODAY],
+                                 itertools.repeat(layout.FUTURE))
+
+    # only pull another day from the sources while there's room for it
+    while not page.full():
         try:
             row = iter.next()
         except StopIteration:
             break
+        priority = priorities.next()
         if len(row) > 1:
-            row.append('')  # to get a nice blank line
-            remaining -= len(row)
-            if remaining > 0:
-                for i in row:
-                    i = i.translate(asciitable)
-                    if len(out) is ((maxlength/3)-2):
-                        # pad the line with dots if it's a good fold point
-                        out.append(str('{0:.<%i}' % maxwidth).format(i))
+            if not page.add([to_ascii(i) for i in row],
+                            priority=priority,
+                            divisible=priority != layout.FUTURE):
+                break
+    # done with the sources; stop their threads
+    iter.close()
+
+    todoiter = (to_ascii(i) for i in iter_random_todo(hm=hm, cache=cache))
+    page.stream(['Todo List Items of the Future...'],
+                (i for i in todoiter if len(i) < maxwidth))
+
+    if timings:
+        for i in sources:
+            sys.stderr.write(i.report() + '\n')
+        sys.stderr.write(clients['calcache'].report() + '\n')
+        sys.stderr.write(page.report() + '\n')
+
+    return page
+
+def render_sheet(clients, **kwargs):
+    """Returns a page of schedule as a list of lines; takes the same
+       arguments as lay_out_sheet."""
+    return lay_out_sheet(clients, **kwargs).lines()
+
+def week_boxes(clients, weather=('Rochester', 'NY'), timings=False,
+               sources=()):
+    """Returns the coming week as boxes for psrender.render_week: a list
+       of lines for each of the seven days, then one for anything
+       overdue.  Accepts sources as more sections (see sheet_sources)."""
+    sources = sheet_sources(clients, weather=weather, extra=sources)
+    rows = [[to_ascii(j) for j in i] for i in
+            iter_text_days(firstoverdue=True, enddelta=7, sources=sources,
+                           maxwidth=200)]
+
+    if timings:
+        for i in sources:
+            sys.stderr.write(i.report() + '\n')
+        sys.stderr.write(clients['calcache'].report() + '\n')
+
+    overdue = rows.pop(0) or ['Nothing overdue']
+    return rows + [overdue]
+
+def sheet_document(out, name, postscript=False):
+    """Makes a sheet into a (name, format, chunks) document for a
+       printjob sink.  out is a list of lines, or if postscript, a
+       PostScript document from psrender."""
+    if postscript:
+        return (name, printjob.POSTSCRIPT, out)
+    return (name, printjob.TEXT, printjob.text_document(out))
+
+def print_sheet(out, printername=None, title="Ryan's Daily Schedule",
+                printer=None, postscript=False, sink=None):
+    """Sends a sheet (a list of lines) to printername (default: the
+       default printer).  Accepts printer as a cups.Connection to reuse.
+       If postscript, out is a PostScript document from psrender instead,
+       as an iterable of chunks.  Accepts sink as a printjob sink to send
+       it to instead (a printjob.FileSink, say)."""
+    if sink is None:
+        sink = printjob.CupsSink(printername, printer)
+    return sink.send([sheet_document(out, title, postscript)], title)
+
+def load_roster(path='~/.printcal-roster'):
+    """Reads a roster of users to print for: an ini file with a section
+       per user, each of which may set gcalclirc, hiveminder, calendardb,
+       city, state, cookiefile, printer, title and sources (the names of
+       more registered sources to print, comma-separated).  %(user)s in
+       any of them is the section's name; other % signs are taken as
+       written.  Returns a list of (user, settings dictionary)."""
+    defaults = {'gcalclirc': '~%(user)s/.gcalclirc',
+                'hiveminder': '~%(user)s/.hiveminder',
+                'calendardb': '~%(user)s/.printcal-calendar.db',
+                'city': 'Rochester', 'state': 'NY',
+                'cookiefile': default_cookiefile,
+                'printer': '', 'title': "%(user)s's Daily Schedule",
+                'sources': ''}
+    roster = ConfigParser.ConfigParser()
+    roster.read(os.path.expanduser(path))
+    users = []
+    for user in roster.sections():
+        settings = dict(defaults)
+        settings.update(roster.items(user, raw=True))
+        for key in settings:
+            settings[key] = os.path.expanduser(
+                settings[key].replace('%(user)s', user))
+        users.append((user, settings))
+    return users
+
+def batch(roster='~/.printcal-roster', workers=4, console=False,
+          offline=False, dryrun=False):
+    """Renders sheets for everyone in the roster (see load_roster) in one
+       process, workers at a time, and then prints them all, one job per
+       printer (or, if console, writes them to stdout; if dryrun, to
+       printcal.out).  Nothing is rendered for anyone whose printer is
+       stopped or not accepting jobs.  The weather is fetched once per
+       city, the Hiveminder connections share DNS, TLS sessions and
+       connections, and everyone shares one printcache.  A timing summary
+       goes to stderr."""
+    everyone = users = load_roster(roster)
+    share = todo.make_share()
+    cache = printcache.Cache()
+
+    # one sink per printer, and skip anyone whose printer is down
+    sinks = {}
+    skipped = {}
+    if dryrun:
+        sink = printjob.FileSink()
+        sinks = dict((i[1]['printer'], sink) for i in users)
+    elif not console:
+        connection = cups.Connection()
+        for printername in set(i[1]['printer'] for i in users):
+            sink = printjob.CupsSink(printername or None, connection)
+            ready, why = sink.ready()
+            if ready:
+                sinks[printername] = sink
+            else:
+                skipped[printername] = why
+        users = [i for i in users if i[1]['printer'] not in skipped]
+
+    # one forecast per city; everyone after the first gets it from cache
+    for city, state in set((i[1]['city'], i[1]['state']) for i in users):
+        miniweather.getweather(city=city, state=state, cache=cache)
+
+    results = {}
+    queue = Queue.Queue()
+    for user in users:
+        queue.put(user)
+
+    def worker():
+        while True:
+            try:
+                user, settings = queue.get_nowait()
+            except Queue.Empty:
+                return
+            began = time.time()
+            try:
+                clients = connect(offline=offline,
+                                  gcalclirc=settings['gcalclirc'],
+                                  hiveminder=settings['hiveminder'],
+                                  calendardb=settings['calendardb'],
+                                  share=share, cache=cache,
+                                  sources=[i.strip() for i in
+                                           settings['sources'].split(',')
+                                           if i.strip()])
+                sheet = render_sheet(clients,
+                                     cookiefile=settings['cookiefile'],
+                                     weather=(settings['city'],
+                                              settings['state']))
+                results[user] = (sheet, time.time() - began, None)
+            except Exception, e:
+                results[user] = (None, time.time() - began, e)
+
+    threads = [threading.Thread(target=worker) for i in xrange(workers)]
+    for i in threads:
+        i.start()
+    for i in threads:
+        i.join()
+
+    status = {}
+    jobs = {}
+    for user, settings in users:
+        sheet, elapsed, error = results[user]
+        status[user] = 'failed: %s' % error
+        if sheet and console:
+            print '\n'.join(sheet)
+            status[user] = 'ok'
+        elif sheet:
+            jobs.setdefault(settings['printer'], []).append(user)
+
+    # everyone's sheet for a printer goes in one job, a document each
+    byuser = dict(users)
+    for printername, names in jobs.items():
+        documents = [sheet_document(results[i][0], byuser[i]['title'])
+                     for i in names]
+        try:
+            sinks[printername].send(documents, 'printcal: %i sheets'
+                                    % len(documents))
+            outcome = 'printed'
+        except Exception, e:
+            outcome = 'print failed: %s' % e
+        for i in names:
+            status[i] = outcome
+
+    for user, settings in everyone:
+        if settings['printer'] in skipped:
+            sys.stderr.write('%-16s %6.2fs  skipped: %s\n' % (user, 0,
+                             skipped[settings['printer']]))
+        else:
+            sys.stderr.write('%-16s %6.2fs  %s\n' % (user,
+                             results[user][1], status[user]))
+
+def make_request_handler():
+    """Returns the daemon's request handler class.  It's built on demand
+       since it subclasses from SocketServer, which is imported lazily."""
+
+    class SheetRequestHandler(SocketServer.StreamRequestHandler):
+        """Answers one request on the daemon's socket: 'console' sends the
+           sheet back, 'print' prints it."""
+
+        def handle(self):
+            command = self.rfile.readline().strip()
+            daemon = self.server.printcal
+            try:
+                if command == 'console':
+                    self.wfile.write('\n'.join(daemon.get_sheet()) + '\n')
+                elif command == 'print':
+                    sink = printjob.CupsSink()
+                    ready, why = sink.ready()
+                    if ready:
+                        print_sheet(daemon.get_sheet(), sink=sink)
+                        self.wfile.write('printed\n')
                     else:
-                        out.append(i)
+                        self.wfile.write('not printed: %s\n' % why)
+                else:
+                    self.wfile.write('unknown command %r\n' % command)
+            except Exception, e:
+                self.wfile.write('failed: %s\n' % e)
+
+    return SheetRequestHandler
 
-    # reset remaining
-    remaining = maxlength - len(footer) - len(out)
+class Daemon:
+    """Keeps the calendar, Hiveminder and cache clients logged in and
+       warm, re-renders the sheet every refresh seconds, and hands it out
+       over a unix socket, so a print request doesn't have to wait on any
+       of them."""
 
-    if remaining > 2:
-        out.append('Todo List Items of the Future...')
-        remaining -= 1
-        todoiter = iter_random_todo(path='/home/rtucker/dev/printcal/todo.py')
+    def __init__(self, clients, refresh=15*60):
+        self.clients = clients
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.sheet = None
+        self.rendered = None    # (midnight, timestamp) of the last render
 
-        while remaining > 0:
+    def render(self):
+        """Renders a new sheet and keeps it"""
+        with self.lock:
+            self.sheet = render_sheet(self.clients)
+            self.rendered = (midnight(), time.time())
+            return self.sheet
+
+    def get_sheet(self):
+        """Returns the kept sheet with a fresh time stamp, or a new one if
+           it's from yesterday or more than refresh seconds old"""
+        sheet, rendered = self.sheet, self.rendered
+        if (not sheet or rendered[0] != midnight()
+                or rendered[1] + self.refresh < time.time()):
+            sheet = self.render()
+        return sheet[:-1] + [stamp_line()]
+
+    def refresher(self):
+        while True:
+            time.sleep(self.refresh)
             try:
-                row = todoiter.next().translate(asciitable)
-                if len(row) < maxwidth:
-                    remaining -= 1
-                    out.append(row)
-            except StopIteration:
-                remaining = 0
+                self.render()
+            except Exception, e:
+                sys.stderr.write('printcal: refresh failed: %s\n' % e)
 
-    out.extend(footer)
+    def serve(self, path='~/.printcal.sock'):
+        """Listens on the unix socket at path until killed"""
+        path = os.path.expanduser(path)
+        if os.path.exists(path):
+            os.unlink(path)
+        server = SocketServer.UnixStreamServer(path, make_request_handler())
+        server.printcal = self
+        self.render()
+        refresher = threading.Thread(target=self.refresher)
+        refresher.setDaemon(True)
+        refresher.start()
+        server.serve_forever()
 
-    if len(sys.argv) > 1:
-        if sys.argv[1] == 'console':
-            print '\n'.join(out)
-            sys.exit(0)
+def request(command, path='~/.printcal.sock'):
+    """Asks a running daemon to do command ('console' or 'print');
+       returns its answer"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(os.path.expanduser(path))
+    sock.sendall(command + '\n')
+    sock.shutdown(socket.SHUT_WR)
+    answer = []
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            break
+        answer.append(data)
+    sock.close()
+    return ''.join(answer)
 
-    printer = cups.Connection()
-    printername = printer.getDefault()
+def main():
+    args = sys.argv[1:]
 
-    tmpfile = tempfile.NamedTemporaryFile()
-    tmpfile.write('\n'.join(out))
-    tmpfile.flush()
-    tmpfile.seek(0)
-    printer.printFile(printername, tmpfile.name, "Ryan's Daily Schedule", {})
-    tmpfile.close()
+    if args[:1] == ['request']:
+        # printcal.py request [console|print]: ask the daemon
+        sys.stdout.write(request((args[1:] or ['console'])[0]))
+        sys.exit(0)
 
-if __name__ == '__main__': main()
+    if args[:1] == ['batch']:
+        # printcal.py batch [roster] [console]: everyone in the roster
+        roster = [i for i in args[1:]
+                  if i not in ('console', 'offline', 'dryrun')]
+        batch(*roster[:1], console='console' in args,
+              offline='offline' in args, dryrun='dryrun' in args)
+        sys.exit(0)
 
+    # dryrun: "print" to printcal.out
+    if 'dryrun' in args:
+        sink = printjob.FileSink()
+    else:
+        sink = printjob.CupsSink()
+    if 'console' not in args and args[:1] != ['daemon']:
+        # don't bother rendering for a printer that won't take it
+        ready, why = sink.ready()
+        if not ready:
+            sys.stderr.write('Not printing: %s\n' % why)
+            sys.exit(1)
+
+    clients = connect(offline='offline' in args)
+
+    if args[:1] == ['daemon']:
+        Daemon(clients).serve()
+        sys.exit(0)
+
+    if 'week' in args:
+        # the week as a grid of days, in PostScript
+        out = psrender.render_week(
+            week_boxes(clients, timings='timings' in args),
+            footer=[stamp_line()])
+    elif 'postscript' in args:
+        out = psrender.render_pages(
+            lay_out_sheet(clients, timings='timings' in args))
+    else:
+        out = render_sheet(clients, timings='timings' in args)
+    postscript = 'week' in args or 'postscript' in args
+
+    if 'console' in args:
+        if postscript:
+            sys.stdout.writelines(out)
+        else:
+            print '\n'.join(out)
+        sys.exit(0)
+
+    print_sheet(out, postscript=postscript, sink=sink)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+
+# Sends printcal's sheets to CUPS without spooling them to a temp file
+# first: the job is created up front and each sheet is streamed into it as
+# a document of its own.  FileSink does the same into a local file, for
+# trying things out without a printer.
+
+from lazyimport import lazy_import
+
+cups = lazy_import('cups')
+
+# document formats
+TEXT = 'text/plain'
+POSTSCRIPT = 'application/postscript'
+
+# the printer-state of a stopped printer (RFC 2911)
+STOPPED = 5
+
+def text_document(lines):
+    """Yields a plain text sheet (a list of lines) as chunks"""
+    for line in lines:
+        yield line + '\n'
+
+def buffered(chunks, size=65536):
+    """Regroups chunks into pieces of about size bytes, so CUPS gets a
+       few big writes rather than one per line"""
+    pending = []
+    length = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(pending)
+            pending = []
+            length = 0
+    if pending:
+        yield ''.join(pending)
+
+class CupsSink:
+    """Prints documents on a CUPS queue, streaming them into the job as
+       they're produced.  Accepts printername (default: the default
+       printer) and connection as a cups.Connection to reuse."""
+
+    def __init__(self, printername=None, connection=None):
+        self.printername = printername
+        self.connection = connection
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = cups.Connection()
+        if not self.printername:
+            self.printername = self.connection.getDefault()
+        return self.connection
+
+    def ready(self):
+        """Returns (True, '') if the queue is taking jobs, or (False, why
+           not) if it's stopped or rejecting them, so there's no need to
+           render anything for it."""
+        connection = self.connect()
+        attrs = connection.getPrinterAttributes(self.printername,
+            requested_attributes=['printer-state', 'printer-state-message',
+                                  'printer-is-accepting-jobs'])
+        if not attrs.get('printer-is-accepting-jobs', True):
+            return False, '%s is not accepting jobs' % self.printername
+        if attrs.get('printer-state') == STOPPED:
+            return False, '%s is stopped: %s' % (self.printername,
+                attrs.get('printer-state-message') or 'no reason given')
+        return True, ''
+
+    def send(self, documents, title):
+        """Prints documents, a list of (name, format, chunks), as one job
+           called title; returns the job id.  If anything goes wrong
+           partway, the job is cancelled."""
+        connection = self.connect()
+        job = connection.createJob(self.printername, title, {})
+        try:
+            for number, (name, format, chunks) in enumerate(documents):
+                connection.startDocument(self.printername, job, name, format,
+                                         number == len(documents) - 1)
+                for piece in buffered(chunks):
+                    connection.writeRequestData(piece, len(piece))
+                connection.finishDocument(self.printername)
+        except Exception:
+            try:
+                connection.cancelJob(job)
+            except Exception:
+                pass
+            raise
+        return job
+
+class FileSink:
+    """Writes documents to the file at path instead of printing them, each
+       job after the first appended to the last"""
+
+    def __init__(self, path='printcal.out'):
+        self.path = path
+        self.jobs = 0
+
+    def ready(self):
+        return True, ''
+
+    def send(self, documents, title):
+        out = open(self.path, self.jobs and 'a' or 'w')
+        try:
+            for name, format, chunks in documents:
+                for piece in buffered(chunks):
+                    out.write(piece)
+        finally:
+            out.close()
+        self.jobs += 1
+        return self.jobs
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+
+# PostScript output for printcal: draws the laid-out sheet, or a week as a
+# grid of day boxes, in the printer's own core fonts, so CUPS can hand it
+# straight to the printer instead of running it through the text filter.
+
+import textwrap
+import time
+
+# US Letter, in points, and the margin all round
+PAGEWIDTH = 612
+PAGEHEIGHT = 792
+MARGIN = 36
+
+# Courier is monospaced, every character this many ems wide
+CHARWIDTH = 0.6
+
+# document prologs, by the font size and leading they were built for
+prologs = {}
+
+def prolog(fontsize, leading):
+    """The fonts and drawing procedures for text of fontsize points on
+       lines leading points apart; built once for each size."""
+    key = (fontsize, leading)
+    if key not in prologs:
+        prologs[key] = '\n'.join([
+            '%%BeginProlog',
+            '/F /Courier findfont %.2f scalefont def' % fontsize,
+            '/B /Courier-Bold findfont %.2f scalefont def' % fontsize,
+            '% (text) x y L: a line of text; H: a heading',
+            '/L { moveto F setfont show } bind def',
+            '/H { moveto B setfont show } bind def',
+            '% y Fold: marks a fold at height y in both margins',
+            '/Fold { gsave 0.6 setgray 0.3 setlinewidth newpath',
+            '  dup 0 exch moveto 18 0 rlineto',
+            '  %i exch moveto -18 0 rlineto stroke grestore } bind def'
+                % PAGEWIDTH,
+            '%%EndProlog',
+            ''])
+    return prologs[key]
+
+def ps_string(text):
+    """text as a PostScript string literal"""
+    return '(%s)' % text.replace('\\', '\\\\').replace(
+        '(', '\\(').replace(')', '\\)')
+
+def header(title, pages):
+    """The document structuring comments that start every document"""
+    return '\n'.join([
+        '%!PS-Adobe-3.0',
+        '%%%%Title: %s' % title,
+        '%%Creator: printcal',
+        '%%%%CreationDate: %s' % time.strftime('%Y-%m-%d %H:%M'),
+        '%%%%Pages: %i' % pages,
+        '%%DocumentNeededResources: font Courier Courier-Bold',
+        '%%EndComments',
+        ''])
+
+def metrics(maxlength, maxwidth):
+    """The font size and leading that fit maxlength lines of maxwidth
+       characters on a page"""
+    leading = float(PAGEHEIGHT - 2*MARGIN) / maxlength
+    fontsize = min(leading / 1.15,
+                   (PAGEWIDTH - 2*MARGIN) / (maxwidth * CHARWIDTH))
+    return round(fontsize, 2), round(leading, 2)
+
+def draw_lines(lines, x, y, leading, headings=0):
+    """PostScript for lines, the first headings of them in bold, from
+       (x, y) down"""
+    out = []
+    for i, line in enumerate(lines):
+        if line:
+            out.append('%s %.2f %.2f %s' % (ps_string(line), x, y,
+                                           i < headings and 'H' or 'L'))
+        y -= leading
+    return out
+
+def render_pages(page, title="Ryan's Daily Schedule"):
+    """Yields a PostScript document a page at a time, drawing the pages
+       of page (a layout.PageLayout) line for line: the first line of
+       each block in bold, the footer at the foot of each page, and fold
+       marks at the thirds."""
+    fontsize, leading = metrics(page.maxlength, page.maxwidth)
+    top = PAGEHEIGHT - MARGIN - fontsize
+
+    # everything but the blocks is the same on every page
+    furniture = ['%.2f Fold' % (PAGEHEIGHT / 3.0),
+                 '%.2f Fold' % (PAGEHEIGHT * 2 / 3.0)]
+    furniture.extend(draw_lines(page.footer, MARGIN,
+                                MARGIN + leading * (len(page.footer) - 1),
+                                leading))
+    furniture.append('showpage')
+    furniture = '\n'.join(furniture) + '\n'
+
+    yield header(title, len(page.pages))
+    yield prolog(fontsize, leading)
+    for number, blocks in enumerate(page.pages):
+        out = ['%%%%Page: %i %i' % (number + 1, number + 1)]
+        y = top
+        for block in blocks:
+            out.extend(draw_lines(block.lines, MARGIN, y, leading, 1))
+            y -= leading * block.size()
+        yield '\n'.join(out) + '\n' + furniture
+    yield '%%EOF\n'
+
+def render_week(boxes, title="Ryan's Week", footer=[], columns=2, rows=4,
+                fontsize=7.5):
+    """Yields a one-page PostScript document with boxes (lists of lines,
+       the first of each a heading) drawn as a grid of columns by rows,
+       left to right and top to bottom, and footer underneath.  Lines are
+       rewrapped to their box; what doesn't fit is left off."""
+    leading = round(fontsize * 1.15, 2)
+    gap = 6
+    width = (PAGEWIDTH - 2*MARGIN - gap * (columns - 1)) / float(columns)
+    height = (PAGEHEIGHT - 2*MARGIN - leading * (len(footer) + 1)
+              - gap * (rows - 1)) / float(rows)
+    wrapper = textwrap.TextWrapper(int((width - 8) / (fontsize * CHARWIDTH)))
+    fits = int((height - 6) / leading)
+
+    yield header(title, 1)
+    yield prolog(fontsize, leading)
+
+    out = ['%%Page: 1 1', '0.5 setlinewidth']
+    for number, box in enumerate(boxes[:columns * rows]):
+        x = MARGIN + (number % columns) * (width + gap)
+        y = PAGEHEIGHT - MARGIN - (number / columns) * (height + gap)
+        out.append('%.2f %.2f %.2f %.2f rectstroke' % (x, y - height,
+                                                       width, height))
+        lines = []
+        for line in box:
+            lines.extend(wrapper.wrap(line) or [''])
+        if len(lines) > fits:
+            lines = lines[:fits - 1] + ['(%i more)' % (len(lines) - fits + 1)]
+        out.extend(draw_lines(lines, x + 4, y - 3 - fontsize, leading, 1))
+    out.extend(draw_lines(footer, MARGIN,
+                          MARGIN + leading * (len(footer) - 1), leading))
+    out.append('showpage')
+    yield '\n'.join(out) + '\n'
+    yield '%%EOF\n'
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+
+# hm_talker.call_many against a stand-in for the webservices endpoint: a
+# threaded BaseHTTPServer that answers each call with its own number, the
+# early calls slowest, and counts how many it's serving at once.
+
+import BaseHTTPServer
+import SocketServer
+import cgi
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import todo
+
+try:
+    import pycurl
+except ImportError:
+    pycurl = None
+
+CALLS = 10
+CONCURRENCY = 3
+
+RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<data><result moniker="fnord"><success>1</success>
+<message>%s %s</message></result></data>
+"""
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        server.enter()
+        try:
+            args = cgi.parse_qs(self.rfile.read(
+                int(self.headers['Content-Length'])))
+            verb = args['J:A-fnord'][0]
+            n = args['J:A:F-n-fnord'][0]
+            if self.path != '/__jifty/webservices/xml' or n == 'fail':
+                # hang up without answering
+                self.close_connection = 1
+                return
+            # answer out of order
+            time.sleep(0.01 * (CALLS - int(n)))
+            body = RESPONSE % (verb, n)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            server.leave()
+
+    def log_message(self, *args):
+        pass
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.lock = threading.Lock()
+        self.serving = self.most = 0
+
+    def enter(self):
+        self.lock.acquire()
+        self.serving += 1
+        self.most = max(self.most, self.serving)
+        self.lock.release()
+
+    def leave(self):
+        self.lock.acquire()
+        self.serving -= 1
+        self.lock.release()
+
+    def handle_error(self, request, client_address):
+        # call_many hangs up on the calls in flight when one fails
+        pass
+
+class Conf:
+    def __init__(self, site):
+        self.config = {'site': site}
+        self.sid_cookie = None
+
+class CallManyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Server()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.hm = todo.hm_talker(Conf('http://127.0.0.1:%i'
+                                      % self.server.server_address[1]))
+
+    def tearDown(self):
+        self.hm.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def calls(self, *numbers):
+        return [('Echo', dict(n=str(i))) for i in numbers]
+
+    def test_results_in_order(self):
+        results = self.hm.call_many(self.calls(*range(CALLS)),
+                                    concurrency=CONCURRENCY)
+        self.assertEqual([(ok, res.findtext('message')) for ok, res in results],
+                         [(True, 'Echo %i' % i) for i in range(CALLS)])
+        self.assertEqual(self.hm.stats['requests'], CALLS)
+
+    def test_concurrency_cap(self):
+        self.hm.call_many(self.calls(*range(CALLS)), concurrency=CONCURRENCY)
+        self.assertEqual(self.server.most, CONCURRENCY)
+
+    def test_default_cap_is_pool_size(self):
+        self.hm.call_many(self.calls(*range(CALLS)))
+        self.assertEqual(self.server.most, self.hm.poolsize)
+
+    def test_failed_transfer(self):
+        calls = self.calls(0, 1, 'fail', 3)
+        self.assertRaises(pycurl.error, self.hm.call_many, calls,
+                          concurrency=2)
+        # nothing left half-done in the pool; the talker still works
+        self.failIf(len(self.hm.pool) > self.hm.poolsize)
+        results = self.hm.call_many(self.calls(7, 8))
+        self.assertEqual([res.findtext('message') for ok, res in results],
+                         ['Echo 7', 'Echo 8'])
+
+if pycurl is None:
+    CallManyTest = unittest.skip('needs pycurl')(CallManyTest)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+
+# Benchmark: decoding a 5,000-task DownloadTasks result, as JSON and as
+# YAML, into Task records, against the old way (the pure-Python YAML loader
+# building a dict per task).  The result bodies are synthetic but shaped
+# like the server's.
+
+import os
+import sys
+import time
+import types
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import todo
+import yaml
+
+COUNT = 5000
+
+def make_tasks():
+    tasks = []
+    for i in xrange(1, COUNT + 1):
+        tasks.append(dict(id=i, summary='Task number %i' % i,
+                          description='Some notes about task %i' % i,
+                          tags='home "big thing"', owner='Me <me@x.org>',
+                          priority=i % 5 + 1, due='2026-10-%02i' % (i % 28 + 1),
+                          starts=None, complete=0, group_id=None,
+                          requestor_id=7, created='2026-09-01 12:00:00',
+                          time_worked='0:00', repeat_period='once'))
+    return tasks
+
+def json_body(tasks):
+    return todo.json.dumps(tasks)
+
+def yaml_body(tasks):
+    out = ['---']
+    for task in tasks:
+        out.append('- !!perl/hash:BTDT::Model::Task')
+        for key, value in sorted(task.items()):
+            if value is None:
+                value = '~'
+            elif isinstance(value, str):
+                value = "'%s'" % value
+            out.append('  %s: %s' % (key, value))
+    return '\n'.join(out) + '\n'
+
+def response(body):
+    """A successful DownloadTasks result element around body"""
+    res = todo.cElementTree.fromstring(
+        '<result moniker="fnord"><success>1</success>'
+        '<content><result></result></content></result>')
+    res.find('content/result').text = body
+    return res
+
+def old_decode(body):
+    """What download_tasks did before: the default yaml loader, dicts kept"""
+    loader = yaml.Loader
+    loader.add_constructor(u'tag:yaml.org,2002:perl/hash:BTDT::Model::Task',
+                           loader.construct_yaml_map)
+    return yaml.load(body, Loader=loader)
+
+def timed(func, *args):
+    began = time.time()
+    value = func(*args)
+    return value, time.time() - began
+
+class DecodeTasksBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.hm = types.InstanceType(todo.hm_talker)
+        self.hm.debug = False
+        self.tasks = make_tasks()
+
+    def test_decode(self):
+        jsonres = response(json_body(self.tasks))
+        yamlbody = yaml_body(self.tasks)
+        yamlres = response(yamlbody)
+
+        fromjson, jsontime = timed(self.hm.decode_tasks, True, jsonres, 'json')
+        fromyaml, yamltime = timed(self.hm.decode_tasks, True, yamlres, 'yaml')
+        old, oldtime = timed(old_decode, yamlbody)
+        sys.stderr.write('\n%i tasks: json %.3fs, yaml %.3fs, old yaml %.3fs\n'
+                         % (COUNT, jsontime, yamltime, oldtime))
+
+        self.assertEqual(len(fromjson), COUNT)
+        self.assertEqual(len(fromyaml), COUNT)
+        for a, b, c in zip(fromjson, fromyaml, old)[::499]:
+            for key in ('id', 'summary', 'tags', 'owner', 'priority', 'due'):
+                self.assertEqual(a[key], b[key])
+                self.assertEqual(str(a[key]), str(c[key]))
+        self.failUnless(isinstance(fromjson[0], todo.Task))
+        self.failUnless(jsontime < oldtime)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+
+# printcal.Feed, over fake sources: days come back in order, a slow day
+# times out without holding up the rest (and its late answer is thrown
+# away), reading ahead is bounded, and close() stops the thread.
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import printcal
+
+class FakeSource:
+    """Yields 0, 1, 2... taking delays[day] seconds (default: none) over
+       each, and raising fail if that's what delays has for the day"""
+    def __init__(self, delays={}, days=None):
+        self.delays = delays
+        self.days = days
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        day = self.read
+        if day == self.days:
+            raise StopIteration
+        delay = self.delays.get(day, 0)
+        if isinstance(delay, Exception):
+            raise delay
+        time.sleep(delay)
+        self.read += 1
+        return day
+
+    def close(self):
+        self.closed = True
+
+def settle():
+    """Gives a feed's thread time to read as far ahead as it will"""
+    time.sleep(0.1)
+
+class FeedTest(unittest.TestCase):
+
+    def test_in_order(self):
+        feed = printcal.Feed('test', FakeSource(days=4))
+        self.assertEqual(list(iter(feed.next, None)), [0, 1, 2, 3])
+
+    def test_runs_out(self):
+        feed = printcal.Feed('test', FakeSource(days=1))
+        self.assertEqual(feed.next(), 0)
+        self.assertRaises(StopIteration, feed.next)
+        self.assertRaises(StopIteration, feed.next)
+
+    def test_slow_day(self):
+        # day 1 misses its 0.4s and turns up at 0.6s, while the reader is
+        # waiting on day 2: that's thrown away, and day 2 is still had
+        source = FakeSource(delays={1: 0.6}, days=3)
+        feed = printcal.Feed('test', source, timeout=0.4)
+        self.assertEqual(feed.next(), 0)
+        began = time.time()
+        self.assertEqual(feed.next(), None)
+        self.failUnless(0.3 < time.time() - began < 0.55)
+        self.assertEqual(feed.next(), 2)
+        self.assertRaises(StopIteration, feed.next)
+
+    def test_failed_source(self):
+        feed = printcal.Feed('test',
+                             FakeSource(delays={1: ValueError('broken')}))
+        self.assertEqual(feed.next(), 0)
+        self.assertEqual(feed.next(), None)
+        self.assertEqual(feed.next(), None)
+
+    def test_reads_depth_ahead(self):
+        source = FakeSource()
+        feed = printcal.Feed('test', source, depth=3)
+        settle()
+        self.assertEqual(source.read, 3)
+        feed.next()
+        settle()
+        self.assertEqual(source.read, 4)
+        feed.close()
+
+    def test_reads_only_wanted(self):
+        wanted = [1]
+        source = FakeSource()
+        feed = printcal.Feed('test', source, depth=3,
+                             wanted=lambda: wanted[0])
+        settle()
+        self.assertEqual(source.read, 1)
+        wanted[0] = 0
+        feed.next()
+        settle()
+        self.assertEqual(source.read, 1)
+        feed.close()
+
+    def test_close(self):
+        source = FakeSource()
+        feed = printcal.Feed('test', source)
+        self.assertEqual(feed.next(), 0)
+        feed.close()
+        feed.join(1)
+        self.failIf(feed.isAlive())
+        self.failUnless(source.closed)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+# Benchmark: formatting a synthetic 1,000-event calendar.  The old way
+# parsed both of each event's time strings and ran strftime on them every
+# time it was formatted; now they're parsed once into calevent.Events when
+# fetched, and rendered times are memoized.  Both have to print the same.
+
+import datetime
+import itertools
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import calevent
+import printcal
+from dateutil.parser import parse
+from dateutil.tz import tzlocal
+
+COUNT = 1000
+DAYS = 7
+
+class Value:
+    """Stands in for the gdata bits calevent.from_entry reads"""
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def make_entries(start):
+    """COUNT gdata-like entries spread over DAYS days from start (a
+       date): mostly timed, some all day, some ending as they start"""
+    entries = []
+    for i in xrange(COUNT):
+        day = start + datetime.timedelta(days=i % DAYS)
+        if i % 10 == 0:
+            begins = day.isoformat()
+            ends = (day + datetime.timedelta(days=1)).isoformat()
+        else:
+            hour, minute = 6 + i % 14, i % 4 * 15
+            begins = '%sT%02i:%02i:00.000Z' % (day, hour, minute)
+            if i % 7 == 0:
+                ends = begins
+            else:
+                ends = '%sT%02i:%02i:00.000Z' % (day, hour + 1, minute)
+        entries.append(Value(
+            when=[Value(start_time=begins, end_time=ends)],
+            where=[Value(value_string=i % 3 and 'Room %i' % i or '')],
+            title=Value(text='Event %i' % i), id=Value(text='id%i' % i),
+            updated=None, content=None))
+    return entries
+
+def old_timestring(eventtime):
+    eventDateTime = parse(eventtime,
+        default=printcal.midnight()).astimezone(tzlocal())
+    meridiem = eventDateTime.strftime('%p').lower()
+    return eventDateTime.strftime('%l:%M') + meridiem
+
+def old_format(row):
+    """format_day_sub_calendar as it was, over gdata-like entries"""
+    out = []
+    for event in row:
+        startTimeStr = old_timestring(event.when[0].start_time)
+        endTimeStr = old_timestring(event.when[0].end_time)
+        if event.where[0].value_string:
+            location = ' (%s)' % event.where[0].value_string
+        else:
+            location = ''
+        if startTimeStr == endTimeStr == '12:00am':
+            out.append('All day: %s' % (event.title.text + location))
+        elif startTimeStr == endTimeStr:
+            out.append('        %-7s  %s' % (startTimeStr,
+                                             event.title.text + location))
+        else:
+            out.append('%-7s-%-7s  %s' % (startTimeStr, endTimeStr,
+                                          event.title.text + location))
+    return out
+
+def timed(func, *args):
+    began = time.time()
+    value = func(*args)
+    return value, time.time() - began
+
+class FakeCalendar(printcal.Source):
+    """A calendar source serving events, bucketed by day"""
+    name = 'calendar'
+    formatter = staticmethod(printcal.format_day_sub_calendar)
+
+    def __init__(self, events):
+        printcal.Source.__init__(self)
+        self.events = events
+
+    def fetch(self, start, end):
+        byday = {}
+        for i in self.events:
+            byday.setdefault(i.start.date(), []).append(i)
+        for i in itertools.count():
+            yield byday.get((start + datetime.timedelta(days=i)).date(), [])
+
+class FormatCalendarBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.start = printcal.midnight()
+        self.entries = make_entries(self.start.date())
+
+    def test_format(self):
+        old, oldtime = timed(old_format, self.entries)
+        events, parsetime = timed(lambda: [calevent.from_entry(i, self.start)
+                                           for i in self.entries])
+        new, newtime = timed(printcal.format_day_sub_calendar, events)
+        sys.stderr.write('\n%i events: old format %.3fs; parse once %.3fs, '
+                         'then format %.3fs\n'
+                         % (COUNT, oldtime, parsetime, newtime))
+        self.assertEqual(old, new)
+        self.failUnless(newtime < oldtime)
+
+    def test_text_days(self):
+        events = [calevent.from_entry(i, self.start) for i in self.entries]
+        days, elapsed = timed(lambda: list(printcal.iter_text_days(
+            start=self.start, enddelta=DAYS,
+            sources=[FakeCalendar(events)])))
+        sys.stderr.write('\n%i events over %i days through iter_text_days: '
+                         '%.3fs\n' % (COUNT, DAYS, elapsed))
+        self.assertEqual(len(days), DAYS)
+        # a heading for each day, and a line per event
+        self.assertEqual(sum(len(i) for i in days), COUNT + DAYS)
+        self.failIf(elapsed > 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
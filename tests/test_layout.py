@@ -0,0 +1,140 @@
+#!/usr/bin/python
+
+# layout.PageLayout with fixed blocks on small pages: what make_room cuts or
+# drops for a more important block, spilling onto more pages, streaming
+# rows into what's left, and the lines that come out.
+
+import itertools
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import layout
+from layout import TODAY, OVERDUE, FUTURE, FILLER
+
+def block(name, count):
+    return ['%s %i' % (name, i) for i in range(count)]
+
+def contents(page):
+    """The first line of each block on each page"""
+    return [[i.lines[0] for i in blocks] for blocks in page.pages]
+
+class PlacingTest(unittest.TestCase):
+
+    def test_fits(self):
+        page = layout.PageLayout(maxlength=10, footer=['foot'])
+        self.failUnless(page.add(block('a', 3)))
+        self.failUnless(page.add(block('b', 2), gap=0))
+        self.assertEqual(page.remaining(), 3)
+        self.assertEqual(page.lines(),
+                         ['a 0', 'a 1', 'a 2', '', 'b 0', 'b 1', 'foot'])
+
+    def test_cuts_less_important(self):
+        page = layout.PageLayout(maxlength=10)
+        page.add(block('filler', 6), FILLER, divisible=True)
+        self.failUnless(page.add(block('today', 4), TODAY))
+        # the filler gives up just the two lines needed
+        self.assertEqual(page.pages[0][0].lines,
+                         ['filler 0', 'filler 1', 'filler 2',
+                          '(3 more not shown)'])
+        self.assertEqual(page.remaining(), 0)
+        self.assertEqual((page.stats['cut'], page.stats['unused']), (1, 3))
+
+    def test_drops_whole_blocks(self):
+        page = layout.PageLayout(maxlength=10)
+        page.add(block('future', 4), FUTURE)
+        page.add(block('filler', 4), FILLER)
+        self.failUnless(page.add(block('today', 6), TODAY))
+        # the filler goes first, then the latest future day
+        self.assertEqual(contents(page), [['today 0']])
+        self.assertEqual(page.stats['dropped'], 2)
+
+    def test_least_important_latest_first(self):
+        page = layout.PageLayout(maxlength=12)
+        page.add(block('overdue', 2), OVERDUE)
+        page.add(block('monday', 2), FUTURE)
+        page.add(block('tuesday', 2), FUTURE)
+        page.add(block('filler', 2), FILLER)
+        self.failUnless(page.add(block('today', 4), TODAY))
+        self.assertEqual(contents(page),
+                         [['overdue 0', 'monday 0', 'today 0']])
+
+    def test_never_cuts_more_important(self):
+        page = layout.PageLayout(maxlength=10)
+        page.add(block('today', 8), TODAY)
+        self.failIf(page.add(block('future', 3), FUTURE))
+        self.assertEqual(contents(page), [['today 0']])
+        self.assertEqual(len(page.pages[0][0].lines), 8)
+        self.assertEqual(page.stats['dropped'], 1)
+
+    def test_cut_to_fit(self):
+        page = layout.PageLayout(maxlength=10)
+        page.add(block('today', 4), TODAY)
+        self.failUnless(page.add(block('overdue', 8), OVERDUE,
+                                 divisible=True))
+        self.assertEqual(page.pages[0][1].lines,
+                         ['overdue 0', 'overdue 1', 'overdue 2',
+                          '(5 more not shown)'])
+
+class PaginationTest(unittest.TestCase):
+
+    def test_spills_onto_next_page(self):
+        page = layout.PageLayout(maxlength=6, footer=['foot'], maxpages=2)
+        page.add(block('a', 3))
+        page.add(block('b', 4))
+        self.assertEqual(contents(page), [['a 0'], ['b 0']])
+        self.failUnless(page.full())
+        self.failIf(page.add(block('c', 1)))
+        self.assertEqual(page.lines(),
+                         ['a 0', 'a 1', 'a 2', '', 'foot',
+                          '\fb 0', 'b 1', 'b 2', 'b 3', '', 'foot'])
+
+    def test_too_big_for_any_page(self):
+        # a whole block bigger than a page stays put, rather than taking a
+        # fresh page it can't fit on either
+        page = layout.PageLayout(maxlength=6, maxpages=2)
+        page.add(block('a', 3))
+        self.failIf(page.add(block('b', 9)))
+        self.assertEqual(len(page.pages), 1)
+
+    def test_days_left(self):
+        page = layout.PageLayout(maxlength=20, maxpages=2)
+        self.assertEqual(page.days_left(guess=8), 5)
+        page.add(block('today', 3), TODAY)
+        page.add(block('overdue', 5), OVERDUE)
+        # 4 lines a day so far, and 10 + 20 lines free
+        self.assertEqual(page.days_left(), 7)
+
+    def test_folds(self):
+        page = layout.PageLayout(maxlength=6, maxwidth=8, folds=[1])
+        page.add(block('a', 3))
+        self.assertEqual(page.lines(), ['a 0', 'a 1.....', 'a 2', ''])
+
+class StreamTest(unittest.TestCase):
+
+    def test_fills_the_page(self):
+        page = layout.PageLayout(maxlength=10)
+        page.add(block('today', 4), TODAY)
+        counter = itertools.count()
+        rows = itertools.imap(str, counter)
+        self.assertEqual(page.stream(['header'], rows), 4)
+        # only as many rows were pulled as were placed
+        self.assertEqual(counter.next(), 4)
+        self.assertEqual(page.lines()[5:], ['header', '0', '1', '2', '3'])
+        self.failUnless(page.full())
+
+    def test_runs_out_of_rows(self):
+        page = layout.PageLayout(maxlength=10)
+        self.assertEqual(page.stream(['header'], ['x', 'y']), 2)
+        self.assertEqual(page.remaining(), 7)
+
+    def test_no_room(self):
+        page = layout.PageLayout(maxlength=10)
+        page.add(block('today', 7), TODAY)
+        self.assertEqual(page.stream(['header', '------'], ['x']), 0)
+        self.assertEqual(contents(page), [['today 0']])
+
+if __name__ == '__main__':
+    unittest.main()
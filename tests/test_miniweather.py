@@ -0,0 +1,246 @@
+#!/usr/bin/python
+
+# Golden tests for miniweather.parseweather.  The first forecasts are in the
+# format the old line-splitting parser understood, and the expected results
+# are what it gave for them (with None where it had False); the rest cover
+# what only the tokenizer handles.  Last, a benchmark runs both parsers over
+# the saved forecasts.
+
+import datetime
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import miniweather
+
+# a Sunday, so Monday is day 1
+TODAY = datetime.date(2026, 10, 18)
+
+AFTERNOON = """
+400 PM EDT SAT OCT 17 2026
+
+Tonight... Mostly cloudy. Low 45.
+Sunday... Partly sunny. High 62.
+Sunday Night... Showers likely. Low 48. Chance of rain 60%
+Monday... Rain. High 55. Chance of rain 80%
+Monday Night... Cloudy. Low 40.
+Tuesday... Sunny, breezy. High 58.
+Tuesday Night... Clear. Low 35.
+Thursday... Chance of showers. High 57.
+"""
+
+MORNING = """
+330 AM EST SUN OCT 18 2026
+
+Today... Snow showers. High 30. Chance of snow 70%
+Tonight... Cloudy. Low 20.
+Monday... Flurries, windy. High 28.
+Monday Night... Cold. Low 12.
+Tuesday... Sunny. High 34.
+"""
+
+EVENING = """
+1000 PM EDT SUN OCT 18 2026
+
+Sunday Night... Clear. Low 50.
+Monday... Sunny. High 75.
+Monday Night... Clear. Low 52.
+Tuesday... Hot. High 90.
+"""
+
+GOLDEN = [
+    (AFTERNOON, {
+        0: (62, 48, 60, 'Partly sunny. High 62.',
+            'Showers likely. Low 48. Chance of rain 60%'),
+        1: (55, 40, 80, 'Rain. High 55. Chance of rain 80%', 'Cloudy. Low 40.'),
+        2: (58, 35, None, 'Sunny', 'Clear. Low 35.'),
+        4: (57, None, None, 'Chance of showers. High 57.', None)}),
+    (MORNING, {
+        1: (28, 12, None, 'Flurries', 'Cold. Low 12.'),
+        2: (34, None, None, 'Sunny. High 34.', None)}),
+    (EVENING, {
+        0: (None, 50, None, None, 'Clear. Low 50.'),
+        1: (75, 52, None, 'Sunny. High 75.', 'Clear. Low 52.'),
+        2: (90, None, None, 'Hot. High 90.', None)}),
+]
+
+class GoldenTest(unittest.TestCase):
+
+    def test_matches_old_parser(self):
+        for text, expected in GOLDEN:
+            got = miniweather.parseweather(text, today=TODAY)
+            self.assertEqual(dict((k, tuple(v)) for k, v in got.items()),
+                             expected)
+
+    def test_unpacks_like_old_tuples(self):
+        high, low, pop, day, night = miniweather.parseweather(
+            EVENING, today=TODAY)[1]
+        self.assertEqual((high, low, pop), (75, 52, None))
+
+# issued on the Friday before TODAY
+FRIDAY = """
+400 PM EDT FRI OCT 16 2026
+
+Tonight... Clear. Low 40.
+Saturday... Sunny. High 62.
+Saturday Night... Cloudy. Low 48.
+Sunday... Rain. High 55.
+Sunday Night... Showers. Low 45.
+Monday... Sunny. High 60.
+"""
+
+class StaleForecastTest(unittest.TestCase):
+
+    def test_counted_from_issue_date(self):
+        entry = miniweather.parse_forecast(FRIDAY)
+        self.assertEqual(entry['parsedon'], datetime.date(2026, 10, 16))
+        self.assertEqual(tuple(entry['forecast'][1]),
+                         (62, 48, None, 'Sunny. High 62.', 'Cloudy. Low 48.'))
+
+    def test_past_days_dropped(self):
+        # read on Sunday, Saturday has gone rather than wrapping round
+        # to next Saturday
+        got = miniweather.current_forecast(miniweather.parse_forecast(FRIDAY),
+                                           today=TODAY)
+        self.assertEqual(dict((k, tuple(v)) for k, v in got.items()), {
+            0: (55, 45, None, 'Rain. High 55.', 'Showers. Low 45.'),
+            1: (60, None, None, 'Sunny. High 60.', None)})
+
+    def test_same_day(self):
+        entry = miniweather.parse_forecast(FRIDAY)
+        self.assertEqual(miniweather.current_forecast(
+            entry, today=datetime.date(2026, 10, 16)), entry['forecast'])
+
+class TokenizerTest(unittest.TestCase):
+
+    def test_product_format(self):
+        # upper case, wrapped lines, "percent", and only the first zone
+        text = """
+.MONDAY...RAIN LIKELY, MAINLY
+IN THE AFTERNOON. HIGH 52. CHANCE OF RAIN 70 PERCENT.
+.MONDAY NIGHT...SHOWERS. LOW 38.
+$$
+.TUESDAY...SUNNY. HIGH 99.
+"""
+        self.assertEqual(miniweather.parseweather(text, today=TODAY),
+                         {1: (52, 38, 70, 'RAIN LIKELY', 'SHOWERS. LOW 38.')})
+
+    def test_plural_highs_and_lows(self):
+        got = miniweather.parseweather(
+            'Monday... Sunny. Highs 60. Lows 38.\n', today=TODAY)
+        self.assertEqual((got[1].high, got[1].low), (60, 38))
+
+    def test_nothing_to_parse(self):
+        self.assertEqual(miniweather.parseweather('', today=TODAY), {})
+
+def old_parseweather(text, today):
+    """The line-splitting parser parseweather replaced, as it was but for
+       taking today as an argument"""
+    forecast = text.split('\n')
+
+    forecastdict = {}
+
+    today = today.weekday()
+
+    lowtempcarry = False
+    hightempcarry = False
+    popcarry = False
+    dayconditionscarry = False
+    nightconditionscarry = False
+
+    for i in forecast:
+        firstword = i.strip().split(' ')[0].strip('.')
+        if firstword in miniweather.daysofweek:
+            forecastdayindex = miniweather.daysofweek.index(firstword)
+            dayoffset = forecastdayindex - today
+            if dayoffset < 0:
+                # damn sundays
+                dayoffset += 7
+            hightempnext = lowtempnext = False
+            hightemp = lowtemp = pop = False
+            dayconditions = nightconditions = False
+            conditions = i.strip().split('...')[1].split(',')[0].strip()
+            if conditions.split(' ')[0] in ['high', 'High', 'low', 'Low']:
+                conditions = False
+            for j in i.strip().split(' '):
+                if hightempnext:
+                    hightempnext = False
+                    hightemp = int(j.strip(',.'))
+                elif lowtempnext:
+                    lowtempnext = False
+                    lowtemp = int(j.strip(',.'))
+                elif j in ['high', 'High']:
+                    hightempnext = True
+                    dayconditions = conditions
+                elif j in ['low', 'Low']:
+                    lowtempnext = True
+                    nightconditions = conditions
+                elif j[-1] == '%':
+                    pop = int(j[:-1])
+
+            if hightemp and lowtemp:
+                forecastdict[dayoffset] = (hightemp, lowtemp, pop, dayconditions, nightconditions)
+            elif hightemp and lowtempcarry:
+                if popcarry:
+                    pop = max(pop, popcarry)
+                if nightconditionscarry:
+                    nightconditions = nightconditionscarry
+                    nightconditionscarry = False
+                forecastdict[dayoffset] = (hightemp, lowtempcarry, pop, dayconditions, nightconditions)
+                lowtempcarry = False
+            elif lowtemp and hightempcarry:
+                if popcarry:
+                    pop = max(pop, popcarry)
+                if dayconditionscarry:
+                    dayconditions = dayconditionscarry
+                    dayconditionscarry = False
+                forecastdict[dayoffset] = (hightempcarry, lowtemp, pop, dayconditions, nightconditions)
+                hightempcarry = False
+            elif lowtemp:
+                if dayoffset == 0:
+                    forecastdict[dayoffset] = (False, lowtemp, pop, False, nightconditions)
+                else:
+                    lowtempcarry = lowtemp
+                    popcarry = pop
+                    nightconditionscarry = nightconditions
+            elif hightemp:
+                hightempcarry = hightemp
+                dayconditionscarry = dayconditions
+                popcarry = pop
+    if hightempcarry:
+        forecastdict[dayoffset] = (hightempcarry, False, False, dayconditionscarry, nightconditions)
+
+    return forecastdict
+
+# the saved forecasts the old parser can read, each parsed this many times
+CORPUS = [AFTERNOON, MORNING, EVENING, FRIDAY]
+ROUNDS = 2000
+
+def timed(parse):
+    began = time.time()
+    for i in xrange(ROUNDS):
+        for text in CORPUS:
+            parse(text, TODAY)
+    return time.time() - began
+
+class CorpusBenchmark(unittest.TestCase):
+
+    def test_corpus(self):
+        oldtime = timed(old_parseweather)
+        newtime = timed(lambda text, today:
+                        miniweather.parseweather(text, today=today))
+        sys.stderr.write('\n%i forecasts: old parser %.3fs, tokenizer %.3fs\n'
+                         % (ROUNDS * len(CORPUS), oldtime, newtime))
+        for text in CORPUS:
+            self.assertEqual(
+                sorted(miniweather.parseweather(text, today=TODAY)),
+                sorted(old_parseweather(text, TODAY)))
+        # the tokenizer does more (wrapped lines, zones, either case), but
+        # may not cost much more for it
+        self.failIf(newtime > 1.5 * oldtime)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/python
+
+# Startup check: importing printcal or todo.py has to stay cheap, so console
+# mode and the daemon's clients don't pay for cups, gcalcli, pycurl and the
+# rest.  Each import is timed in a fresh interpreter.
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# seconds an import may take; a regression to importing gcalcli (and gdata)
+# or cups up front blows well past this
+BUDGET = 0.5
+
+# what neither module may load just by being imported
+HEAVY = ['cups', 'gcalcli', 'gdata', 'pycurl', 'yaml', 'sqlite3',
+         'calcache', 'printcache', 'miniweather', 'weather', 'SocketServer']
+
+PROBE = """
+import sys, time
+sys.path.insert(0, %r)
+began = time.time()
+import %s
+print time.time() - began
+print ' '.join(sorted(sys.modules))
+"""
+
+def probe(module):
+    """Imports module in a new python; returns (seconds, modules loaded)"""
+    child = subprocess.Popen([sys.executable, '-c', PROBE % (ROOT, module)],
+                             stdout=subprocess.PIPE)
+    out = child.communicate()[0]
+    if child.returncode:
+        raise AssertionError('import %s failed' % module)
+    elapsed, modules = out.strip().split('\n')[-2:]
+    return float(elapsed), set(modules.split())
+
+class StartupTest(unittest.TestCase):
+
+    def check(self, module):
+        elapsed, modules = probe(module)
+        self.assertEqual([i for i in HEAVY if i in modules], [])
+        self.failIf(elapsed > BUDGET, 'import %s took %.3fs (budget %.1fs)'
+                    % (module, elapsed, BUDGET))
+
+    def test_printcal(self):
+        self.check('printcal')
+
+    def test_todo(self):
+        self.check('todo')
+
+if __name__ == '__main__':
+    unittest.main()
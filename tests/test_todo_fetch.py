@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+# Benchmark: a week of todo items for the sheet, fetched by running todo.py
+# once a day (iter_todo) against one in-process DownloadTasks (iter_todo_hm).
+# Both ends are stand-ins serving the same synthetic task list, so the
+# difference is the process startups; the two have to agree line for line.
+
+import datetime
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import printcal
+import todo
+
+# three tasks a day, from three days overdue to a fortnight out
+TASKS = """
+import datetime
+def make_tasks():
+    today = datetime.date.today()
+    tasks = []
+    for day in range(-3, 14):
+        for n in range(3):
+            tasks.append(dict(id=len(tasks) + 1, summary='task %i' % n,
+                              description='', tags='a b', owner='me@x.org',
+                              priority=3,
+                              due=str(today + datetime.timedelta(days=day))))
+    return tasks
+"""
+
+# what todo.py --due <when> list prints, for the tasks above
+STUB = """#!%(python)s
+import datetime, sys
+sys.path.insert(0, %(root)r)
+import todo
+%(tasks)s
+when = sys.argv[sys.argv.index('--due') + 1]
+today = datetime.date.today()
+tasks = [todo.Task(i) for i in make_tasks()]
+if when == 'before/today':
+    tasks = [i for i in tasks if i['due'] < str(today)]
+else:
+    tasks = [i for i in tasks if i['due'] == when.replace('/', '-')]
+for line in todo.format_task_list(tasks):
+    print line
+"""
+
+exec TASKS
+
+class StubTalker:
+    """Answers download_tasks with the tasks above"""
+    def download_tasks(self, query):
+        return [todo.Task(i) for i in make_tasks()]
+
+class TodoFetchBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'todo.py')
+        stub = open(self.path, 'w')
+        stub.write(STUB % dict(python=sys.executable, root=ROOT, tasks=TASKS))
+        stub.close()
+        os.chmod(self.path, stat.S_IRWXU)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def week(self, **kwargs):
+        start = printcal.midnight()
+        began = time.time()
+        if 'hm' in kwargs:
+            days = printcal.iter_todo_hm(start=start, firstoverdue=True,
+                                         end=start + datetime.timedelta(days=7),
+                                         **kwargs)
+        else:
+            days = printcal.iter_todo(start=start, firstoverdue=True,
+                                      end=start + datetime.timedelta(days=7),
+                                      **kwargs)
+        days = list(days)
+        return days, time.time() - began
+
+    def test_in_process_is_faster(self):
+        forked, forktime = self.week(path=self.path)
+        inproc, inproctime = self.week(hm=StubTalker())
+        sys.stderr.write('\niter_todo %.3fs, iter_todo_hm %.3fs (%i days)\n'
+                         % (forktime, inproctime, len(inproc)))
+        self.assertEqual(forked, inproc)
+        self.assertEqual(len(inproc), 8)
+        self.assertEqual(len(inproc[0]), 10)    # the priority heading, 9 tasks
+        self.failUnless(inproctime < forktime)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,6 +23,8 @@
 # THE SOFTWARE.
 #
 #
+import cPickle
+import datetime
 import optparse
 import os
 ## import syck # for now, consider something simpler
@@ -30,38 +32,44 @@ import os
 import urllib
 import getpass
 # import ydump
-import pycurl
+from lazyimport import lazy_import
 import StringIO
 import sys
 import stat
 import itertools
 import operator
 import string
-import yaml
-# get cElementTree from *somewhere*...
-try:
-    import cElementTree
-except ImportError:
-    try:
-        import xml.etree.ElementTree as cElementTree
-    except ImportError:
-        import elementtree.ElementTree as cElementTree
 import re
+import shlex
+import time
+# the heavy ones only load when first used, so importing todo is cheap
+pycurl = lazy_import('pycurl')
+sqlite3 = lazy_import('sqlite3')
+yaml = lazy_import('yaml')
+# get cElementTree from *somewhere*...
+cElementTree = lazy_import('cElementTree', 'xml.etree.cElementTree',
+                           'xml.etree.ElementTree', 'elementtree.ElementTree')
 # Python version of BestPractical's Hiveminder todo.pl, so I can import it and extend it
 
-# need to force some handlers for exposed objects...
-yaml.constructor.Constructor.add_constructor(
-    u'tag:yaml.org,2002:perl/hash:BTDT::Model::Task',
-    yaml.constructor.Constructor.construct_yaml_map)
+json = lazy_import('json', 'simplejson')
 
-yaml.constructor.Constructor.add_constructor(
-    u'tag:yaml.org,2002:perl/hash:BTDT::Model::User',
-    yaml.constructor.Constructor.construct_yaml_map)
-
-yaml.constructor.Constructor.add_constructor(
-    u'tag:yaml.org,2002:perl/hash:BTDT::CurrentUser',
-    yaml.constructor.Constructor.construct_yaml_map)
+# the yaml Loader class to use, once it's been picked
+yaml_loader = None
 
+def load_yaml(stream):
+    """yaml.load for DownloadTasks results, with libyaml's C loader if we
+    have it, after forcing some handlers for exposed objects.  It's a safe
+    loader, so not for the config file, which yaml.dump writes with
+    python/unicode tags"""
+    global yaml_loader
+    if yaml_loader is None:
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        for tag in (u'tag:yaml.org,2002:perl/hash:BTDT::Model::Task',
+                    u'tag:yaml.org,2002:perl/hash:BTDT::Model::User',
+                    u'tag:yaml.org,2002:perl/hash:BTDT::CurrentUser'):
+            loader.add_constructor(tag, loader.construct_yaml_map)
+        yaml_loader = loader
+    return yaml.load(stream, Loader=yaml_loader)
 
 
 # Original docs:
@@ -72,10 +80,10 @@ usage = """todo.py [options] list
   todo.py [options] add <summary>
   todo.py [options] edit <task-id> [summary]
 
-  todo.py tag <task-id> tag1 tag2
+  todo.py tag <task-id>[,<task-id>...] tag1 tag2
 
-  todo.py done <task-id>
-  todo.py del|rm <task-id>
+  todo.py done <task-id>...
+  todo.py del|rm <task-id>...
 
   todo.py [options] pending
   todo.py accept <task-id>
@@ -84,7 +92,7 @@ usage = """todo.py [options] list
   todo.py assign <task-id> <email>
   todo.py [options] requests
 
-  todo.py hide <task-id> date
+  todo.py hide <task-id>... date
 
   todo.py comment <task-id>
 
@@ -98,6 +106,8 @@ usage = """todo.py [options] list
        --due                            Operate on tasks due on a given day
        --hide                           Operate on tasks hidden until this day
        --owner                          Operate on tasks with a given owner
+       --offline                        List from the local task index only
+       --refresh                        Download lists again, not from the index
 
 
   todo.py list
@@ -152,14 +162,16 @@ def decode_locator(locator):
     # then compact into 32-contiguous values for int
     return int(locator.upper().translate(rep_to_map).translate(loc_to_rep), 32)
 
-# tests, from Number-RecordLocator-0.001/t/00.load.t
-assert encode_locator(1) == "3", "We skip one and zero so should end up with 3 when encoding 1"
-assert encode_locator(12354) == 'F44'
-assert encode_locator(123456) == '5RL2'
-assert decode_locator('5RL2') == 123456
-assert decode_locator(encode_locator(123456)) == 123456
-assert decode_locator('1234') == decode_locator('I234')
-assert decode_locator('10SB') == decode_locator('IOFP')
+def check_locators():
+    """tests, from Number-RecordLocator-0.001/t/00.load.t; run by the
+       command line, not on every import"""
+    assert encode_locator(1) == "3", "We skip one and zero so should end up with 3 when encoding 1"
+    assert encode_locator(12354) == 'F44'
+    assert encode_locator(123456) == '5RL2'
+    assert decode_locator('5RL2') == 123456
+    assert decode_locator(encode_locator(123456)) == 123456
+    assert decode_locator('1234') == decode_locator('I234')
+    assert decode_locator('10SB') == decode_locator('IOFP')
 
 # encode_locator('A')
 # return undef in perl, but clearly should raise here...
@@ -187,7 +199,7 @@ class hm_config:
         """Load the class from the file"""
         if not os.path.exists(self.conffile):
             return # raise?
-        self.config = yaml.load(file(self.conffile))
+        self.config = yaml.load(file(self.conffile), Loader=yaml.Loader)
 
         # if "sid" in self.config:
         #     print "loading cookie:", repr(self.config["sid"])
@@ -244,17 +256,184 @@ def make_sid_cookie(sid, uri):
 
 
 
+def make_share():
+    """A pycurl.CurlShare for several hm_talkers to pool their DNS
+    lookups, TLS sessions and (where libcurl can) connections.  Cookies
+    are deliberately not shared: every talker keeps its own session."""
+    share = pycurl.CurlShare()
+    share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+    # newer in pycurl than the rest
+    for lock in ["LOCK_DATA_SSL_SESSION", "LOCK_DATA_CONNECT"]:
+        if hasattr(pycurl, lock):
+            share.setopt(pycurl.SH_SHARE, getattr(pycurl, lock))
+    return share
+
+class response_target:
+    """XMLParser target that builds just the top-level <result> of a
+    webservices response, and lets everything else go by"""
+    def __init__(self):
+        self.builder = cElementTree.TreeBuilder()
+        self.depth = 0
+        self.keeping = False
+        self.result = None
+        self.success = None
+    def start(self, tag, attrib):
+        self.depth += 1
+        if self.depth == 2 and tag == "result" and self.result is None:
+            self.keeping = True
+        if self.keeping:
+            self.builder.start(tag, attrib)
+    def end(self, tag):
+        if self.keeping:
+            elem = self.builder.end(tag)
+            if self.depth == 3 and tag == "success":
+                # known as soon as it's arrived, before the bulky content
+                self.success = elem.text
+            if self.depth == 2:
+                self.keeping = False
+                self.result = elem
+        self.depth -= 1
+    def data(self, data):
+        if self.keeping:
+            self.builder.data(data)
+    def close(self):
+        return self.result
+
+class response_reader:
+    """curl WRITEFUNCTION that parses the response as it arrives, instead
+    of collecting the whole body first; close() returns the <result>"""
+    def __init__(self, debug=False):
+        self.target = response_target()
+        self.parser = cElementTree.XMLParser(target=self.target)
+        self.size = 0
+        self.error = None
+        # only keep the raw body around if it's going to be printed
+        self.raw = debug and StringIO.StringIO()
+    def write(self, data):
+        self.size += len(data)
+        if self.raw:
+            self.raw.write(data)
+        if self.error is None:
+            # raising in here would just get us a curl write error
+            try:
+                self.parser.feed(data)
+            except Exception, e:
+                self.error = e
+    @property
+    def success(self):
+        return self.target.success
+    def close(self):
+        if self.error is None:
+            self.parser.close()
+        if self.error is not None:
+            raise self.error
+        return self.target.result
+
 class hm_talker:
     """handles the protocol"""
     user_agent = "%s/0.01" % os.path.basename(__file__)
-    def __init__(self, conf, debug=False):
-        """talk hm protocol to the configured site"""
+    def __init__(self, conf, debug=False, poolsize=4, share=None):
+        """talk hm protocol to the configured site; share is an optional
+        pycurl.CurlShare (see make_share) for talkers of different users
+        to pool DNS, TLS sessions and connections through"""
         self.conf = conf
         self.last_sid = None
         self.debug = debug
+        self.share = share
+        # idle curl handles; libcurl keeps each one's connection (and TLS
+        # session) alive, so handing them back out skips the reconnect
+        self.poolsize = poolsize
+        self.pool = []
+        self.stats = dict(requests=0, connections_opened=0, connections_reused=0)
+
+    def get_handle(self):
+        """Take an idle curl handle from the pool, or make a new one"""
+        if self.pool:
+            ua = self.pool.pop()
+            ua.reset() # keeps the connection and the cookies, drops options
+        else:
+            ua = pycurl.Curl() # perlish "user agent"
+        if self.debug: ua.setopt(pycurl.VERBOSE, 1)
+        ua.setopt(pycurl.USERAGENT, self.user_agent)
+        ua.setopt(pycurl.COOKIEFILE, "") # turn on the cookie engine
+        if self.share is not None:
+            ua.setopt(pycurl.SHARE, self.share)
+        if hasattr(pycurl, "TCP_KEEPALIVE"):
+            ua.setopt(pycurl.TCP_KEEPALIVE, 1)
+        return ua
+
+    def release_handle(self, ua):
+        """Give a handle back to the pool once its transfer is done"""
+        if len(self.pool) < self.poolsize:
+            self.pool.append(ua)
+        else:
+            ua.close()
 
-    def call(self, verb, **kwargs):
-        """Do some yamlrpc"""
+    def close(self):
+        """Drop all pooled handles (and their connections)"""
+        while self.pool:
+            self.pool.pop().close()
+
+    def sid_cookie(self):
+        """The JIFTY_SID_* cookie to send, if we have one"""
+        # the stored sid wins over the scraped one, as it always has
+        if "sid" in self.conf.config:
+            return make_sid_cookie(self.conf.config["sid"], None)
+        if self.last_sid:
+            return make_sid_cookie(self.last_sid, None)
+        return self.conf.sid_cookie
+
+    def finish_transfer(self, ua):
+        """Bookkeeping after ua.perform(): cookies, stats, status"""
+        if self.debug: print "SIZE_UPLOAD:", ua.getinfo(pycurl.SIZE_UPLOAD)
+        if self.debug: print "CONTENT_LENGTH_UPLOAD:", ua.getinfo(pycurl.CONTENT_LENGTH_UPLOAD)
+        http_status = ua.getinfo(pycurl.HTTP_CODE)
+        if self.debug: print "HTTP STATUS:", http_status
+        rawcookies = ua.getinfo(pycurl.INFO_COOKIELIST)
+        self.last_sid = self.extract_sid_value(rawcookies) or self.last_sid
+
+        # NUM_CONNECTS is how many new connections this transfer needed
+        connects = ua.getinfo(pycurl.NUM_CONNECTS)
+        self.stats["requests"] += 1
+        if connects:
+            self.stats["connections_opened"] += connects
+        else:
+            self.stats["connections_reused"] += 1
+        if self.debug: print "CONNECTION STATS:", self.stats
+        return http_status
+
+    def setup_transfer(self, ua, uri, poststr, respio):
+        """Point handle ua at uri, POSTing poststr (if any) into respio"""
+        if poststr is not None:
+            postio = StringIO.StringIO(poststr)
+            ua.setopt(pycurl.POST, 1)
+            ua.setopt(pycurl.POSTFIELDSIZE, len(poststr))
+            ua.setopt(pycurl.READFUNCTION, postio.read)
+        ua.setopt(pycurl.WRITEFUNCTION, respio.write)
+        ua.setopt(pycurl.URL, uri)
+        cookie = self.sid_cookie()
+        if cookie:
+            ua.setopt(pycurl.COOKIE, cookie)
+
+    def perform(self, uri, poststr=None, respio=None):
+        """GET (or POST poststr to) uri on a pooled handle, writing the
+        body into respio (default: a new StringIO); returns respio"""
+        if respio is None:
+            respio = StringIO.StringIO()
+        ua = self.get_handle()
+        try:
+            self.setup_transfer(ua, uri, poststr, respio)
+            ua.perform()
+            self.finish_transfer(ua)
+        except pycurl.error:
+            # don't put a handle in an unknown state back in the pool
+            ua.close()
+            raise
+        self.release_handle(ua)
+        return respio
+
+    def build_call(self, verb, kwargs):
+        """Turn a verb and its arguments into (uri, poststr)"""
         moniker = "fnord"
 
         posturi = self.conf.config["site"] + "/__jifty/webservices/xml"
@@ -264,87 +443,94 @@ class hm_talker:
         poststr = urllib.urlencode(postargs)
         if self.debug: print "POSTING:", poststr
         if self.debug: print "TO:", posturi
-        postio = StringIO.StringIO(poststr)
+        return posturi, poststr
 
-        respio = StringIO.StringIO()
-        ua = pycurl.Curl() # perlish "user agent"
-        ua.setopt(pycurl.POST, 1)
-        ua.setopt(pycurl.POSTFIELDSIZE, len(poststr))
-        ua.setopt(pycurl.READFUNCTION, postio.read)
-        ua.setopt(pycurl.WRITEFUNCTION, respio.write)
-        ua.setopt(pycurl.URL, posturi)
-        if self.debug: ua.setopt(pycurl.VERBOSE, 1)
-        ua.setopt(pycurl.USERAGENT, self.user_agent)
-        # in theory at least:
-        if self.last_sid:
-            # print "setting scraped sid_cookie:"
-            ua.setopt(pycurl.COOKIE, make_sid_cookie(self.last_sid, None))
-        if "sid" in self.conf.config:
-            # print "setting stored sid_cookie:"
-            ua.setopt(pycurl.COOKIE, make_sid_cookie(self.conf.config["sid"], None))
-        ua.setopt(pycurl.COOKIELIST, "") # get cookies *back*
-        ua.perform()
-
-        if self.debug: print "SIZE_UPLOAD:", ua.getinfo(pycurl.SIZE_UPLOAD)
-        if self.debug: print "CONTENT_LENGTH_UPLOAD:", ua.getinfo(pycurl.CONTENT_LENGTH_UPLOAD)
-        http_status = ua.getinfo(pycurl.HTTP_CODE)
-        if self.debug: print "HTTP STATUS:", http_status
-        rawcookies = ua.getinfo(pycurl.INFO_COOKIELIST)
-        self.last_sid = self.extract_sid_value(rawcookies)
-
-        # res = (urllib or curl).post(posturi, postargs)
-        res = respio.getvalue()
-        if res:
-            if self.debug: print "RAW RES:", repr(res)
+    def parse_response(self, reader):
+        """Pick (success, result element) out of a webservices response,
+        as parsed by a response_reader"""
+        if reader.size:
+            if self.debug: print "RAW RES:", repr(reader.raw.getvalue())
             # return yaml.load(res)[moniker]
-            parsedres = cElementTree.fromstring(res)
-            if self.debug: print "RAW XML:", parsedres
-            realresult = parsedres.find("result")
-            assert realresult.get("moniker") == "fnord", "wrong moniker in response %s" % parsedres.items()
-            success = realresult.find("success").text
+            realresult = reader.close()
+            if self.debug: print "RAW XML:", realresult
+            assert realresult is not None, "no result in response"
+            assert realresult.get("moniker") == "fnord", "wrong moniker in response %s" % realresult.items()
+            success = reader.success
             if success != "1":
                 print "unsuccessful!"
             return success == "1", realresult
         print "OOPS, no response to call"
         return None, None
 
+    def call(self, verb, **kwargs):
+        """Do some yamlrpc"""
+        posturi, poststr = self.build_call(verb, kwargs)
+        # res = (urllib or curl).post(posturi, postargs)
+        reader = response_reader(self.debug)
+        self.perform(posturi, poststr, reader)
+        return self.parse_response(reader)
+
+    def call_many(self, calls, concurrency=None):
+        """Do a list of (verb, kwargs) calls at once, at most concurrency
+        (default: the pool size) in flight on one CurlMulti; returns the
+        (success, result) pairs in the same order as calls"""
+        if concurrency is None:
+            concurrency = self.poolsize
+        results = [None] * len(calls)
+        pending = list(enumerate(calls))
+        pending.reverse()
+        multi = pycurl.CurlMulti()
+        active = {} # handle -> (index, respio)
+        try:
+            while pending or active:
+                while pending and len(active) < concurrency:
+                    index, (verb, kwargs) = pending.pop()
+                    posturi, poststr = self.build_call(verb, kwargs)
+                    respio = response_reader(self.debug)
+                    ua = self.get_handle()
+                    self.setup_transfer(ua, posturi, poststr, respio)
+                    multi.add_handle(ua)
+                    active[ua] = (index, respio)
+
+                ret = pycurl.E_CALL_MULTI_PERFORM
+                while ret == pycurl.E_CALL_MULTI_PERFORM:
+                    ret, running = multi.perform()
+
+                finished = 0
+                while True:
+                    queued, done, failed = multi.info_read()
+                    for ua in done:
+                        multi.remove_handle(ua)
+                        index, respio = active.pop(ua)
+                        self.finish_transfer(ua)
+                        self.release_handle(ua)
+                        results[index] = self.parse_response(respio)
+                    for ua, errno, errmsg in failed:
+                        multi.remove_handle(ua)
+                        active.pop(ua)
+                        ua.close()
+                        raise pycurl.error(errno, errmsg)
+                    finished += len(done)
+                    if not queued:
+                        break
+
+                if active and not finished:
+                    multi.select(1.0)
+        finally:
+            for ua in active:
+                multi.remove_handle(ua)
+                ua.close()
+            multi.close()
+        return results
+
     def altcall(self, query):
         """Do some jesse hacks"""
         moniker = "fnord"
 
         posturi = query # self.conf.config["site"] + "/__jifty/webservices/xml"
-        #postargs = {"J:A-%s" % moniker: verb}
-        #for key, val in kwargs.items():
-        #    postargs["J:A:F-%s-%s" % (key, moniker)] = val
-        #poststr = urllib.urlencode(postargs)
-        #if self.debug: print "POSTING:", poststr
         if self.debug: print "TO:", posturi
-        #postio = StringIO.StringIO(poststr)
 
-        respio = StringIO.StringIO()
-        ua = pycurl.Curl() # perlish "user agent"
-        #ua.setopt(pycurl.POST, 1)
-        #ua.setopt(pycurl.POSTFIELDSIZE, len(poststr))
-        #ua.setopt(pycurl.READFUNCTION, postio.read)
-        ua.setopt(pycurl.WRITEFUNCTION, respio.write)
-        ua.setopt(pycurl.URL, posturi)
-        if self.debug: ua.setopt(pycurl.VERBOSE, 1)
-        ua.setopt(pycurl.USERAGENT, self.user_agent)
-        # in theory at least:
-        if self.conf.sid_cookie:
-            ua.setopt(pycurl.COOKIE, self.conf.sid_cookie)
-        ua.setopt(pycurl.COOKIELIST, "") # get cookies *back*
-        ua.perform()
-
-        if self.debug: print "SIZE_UPLOAD:", ua.getinfo(pycurl.SIZE_UPLOAD)
-        if self.debug: print "CONTENT_LENGTH_UPLOAD:", ua.getinfo(pycurl.CONTENT_LENGTH_UPLOAD)
-        http_status = ua.getinfo(pycurl.HTTP_CODE)
-        if self.debug: print "HTTP STATUS:", http_status
-        rawcookies = ua.getinfo(pycurl.INFO_COOKIELIST)
-        self.last_sid = self.extract_sid_value(rawcookies)
-
-        # res = (urllib or curl).post(posturi, postargs)
-        res = respio.getvalue()
+        res = self.perform(posturi).getvalue()
         if res:
             if self.debug: print "RAW RES:", repr(res)
             if self.debug: print "PRETTY RES:", str(res)
@@ -392,17 +578,409 @@ class hm_talker:
     # basic marshalling functions
     # these were split out in the perl code, maybe they should
     # be more generic?
-    def download_tasks(self, query):
+    def task_format(self):
+        """The DownloadTasks format to ask for: JSON decodes much faster
+        than YAML, so it's used unless the server has turned it down"""
+        return self.conf.config.get("task_format", "json")
+
+    def download_tasks(self, query, format=None):
+        format = format or self.task_format()
         ok, res = self.call("DownloadTasks",
                             query=query,
-                            format="yaml")
+                            format=format)
+        try:
+            return self.decode_tasks(ok, res, format)
+        except ValueError, e:
+            if format == "yaml":
+                raise
+        tasks = self.download_tasks(query, format="yaml")
+        self.remember_format(e)
+        return tasks
+
+    def download_tasks_many(self, queries, concurrency=None, format=None):
+        """download_tasks for several queries at once, results in order"""
+        format = format or self.task_format()
+        calls = [("DownloadTasks", dict(query=query, format=format)) for query in queries]
+        try:
+            return [self.decode_tasks(ok, res, format) for ok, res in self.call_many(calls, concurrency)]
+        except ValueError, e:
+            if format == "yaml":
+                raise
+        tasks = self.download_tasks_many(queries, concurrency, format="yaml")
+        self.remember_format(e)
+        return tasks
+
+    def remember_format(self, error):
+        """After falling back to YAML because of error: if the server
+        turned JSON down, stick with YAML from now on; anything else
+        (a failed call, a garbled result) is only worked around once"""
+        if isinstance(error, FormatRejected):
+            self.conf.config["task_format"] = "yaml"
+            self.conf.save_config()
+
+    # bulk mutations: one call per task, all in flight together through
+    # call_many; each returns the (success, result) pairs in task order
+    def update_tasks(self, task_ids, concurrency=None, **fields):
+        """UpdateTask each of task_ids (numbers) with the same fields"""
+        calls = [("UpdateTask", dict(fields, id=task_id)) for task_id in task_ids]
+        return self.call_many(calls, concurrency)
+
+    def delete_tasks(self, task_ids, concurrency=None):
+        """DeleteTask each of task_ids (numbers)"""
+        return self.call_many([("DeleteTask", dict(id=task_id)) for task_id in task_ids],
+                              concurrency)
+
+    def tag_tasks(self, task_ids, new_tags, current=None, concurrency=None):
+        """Add new_tags to each of task_ids (numbers).  current maps task
+        ids to their tags strings where they're already known; the rest
+        are read in one batch of downloads before anything is written."""
+        current = dict(current or {})
+        missing = [task_id for task_id in task_ids if task_id not in current]
+        if missing:
+            found = self.download_tasks_many(["id/%s" % encode_locator(task_id)
+                                              for task_id in missing], concurrency)
+            for task_id, tasks in zip(missing, found):
+                if not tasks:
+                    raise Exception("no task %s" % encode_locator(task_id))
+                current[task_id] = tasks[0]["tags"] or ""
+        calls = [("UpdateTask", dict(id=task_id,
+                                     tags=(current[task_id] + " " + join_tags(new_tags)).strip()))
+                 for task_id in task_ids]
+        return self.call_many(calls, concurrency)
+
+    def decode_tasks(self, ok, res, format="yaml"):
+        """Unpack the task list from a DownloadTasks response into Task
+        records; raises ValueError if it isn't a task list in format"""
         if self.debug: print "download_tasks got:", ok, repr(res)
         # return yaml.load(res["_content"]["result"])
         # print cElementTree.tostring(res)
-        if not ok:
+        if not ok and format == "yaml":
             raise Exception(res.find("message").text)
-        return yaml.load(res.find("content/result").text)
+        elif not ok and format_rejected(res, format):
+            raise FormatRejected(res.find("message").text)
+        elif not ok:
+            raise ValueError(res.find("message").text)
+        result = res.find("content/result").text
+        if format == "json":
+            # a task at a time, so there's only ever one dict about
+            return [Task(task) for task in iter_json_list(result or "")]
+        # YAML comes back whole, dicts and all; swap each for its record
+        tasks = load_yaml(result) or []
+        if not isinstance(tasks, list):
+            raise ValueError("%s result is not a task list" % format)
+        for i, task in enumerate(tasks):
+            tasks[i] = Task(task)
+        return tasks
+
+json_space = re.compile(r"[ \t\n\r]*")
+
+def iter_json_list(text):
+    """Yield the items of the JSON list in text, decoding each one as it's
+    reached; raises ValueError if text isn't a JSON list"""
+    decoder = json.JSONDecoder()
+    index = json_space.match(text).end()
+    if text[index:index + 1] != "[":
+        raise ValueError("result is not a JSON list")
+    index = json_space.match(text, index + 1).end()
+    if text[index:index + 1] != "]":
+        while True:
+            item, index = decoder.raw_decode(text, index)
+            yield item
+            index = json_space.match(text, index).end()
+            if text[index:index + 1] != ",":
+                break
+            index = json_space.match(text, index + 1).end()
+        if text[index:index + 1] != "]":
+            raise ValueError("expected , or ] at %d in JSON list" % index)
+    if json_space.match(text, index + 1).end() != len(text):
+        raise ValueError("extra data after JSON list")
+
+class FormatRejected(ValueError):
+    """the server won't do DownloadTasks in the format asked for"""
+
+def format_rejected(res, format):
+    """does an unsuccessful DownloadTasks result say format is the problem?"""
+    if res is None:
+        return False
+    error = res.find("field_errors/format")
+    if error is not None and error.text:
+        return True
+    message = res.find("message")
+    text = message is not None and message.text or ""
+    return "format" in text.lower() and format in text.lower()
+
+class Task(object):
+    """One task from DownloadTasks, keeping just the fields todo.py and
+    printcal look at.  It reads like the dict it came from: task["id"],
+    task.get("due"), "last_repeat" in task."""
+    __slots__ = ("id", "summary", "description", "tags", "owner", "priority",
+                 "due", "starts", "complete", "group_id", "last_repeat")
+
+    def __init__(self, fields):
+        for key in self.__slots__:
+            if key in fields:
+                value = fields[key]
+                if isinstance(value, unicode):
+                    # plain strs where they'll do, as the yaml loader gives
+                    try:
+                        value = value.encode("ascii")
+                    except UnicodeError:
+                        pass
+                setattr(self, key, value)
+
+    def __getitem__(self, key):
+        if key in self.__slots__ and hasattr(self, key):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def get(self, key, default=None):
+        if key in self:
+            return getattr(self, key)
+        return default
+
+    def __repr__(self):
+        return "<Task %s %r>" % (self.get("id"), self.get("summary"))
+
+    def fields(self):
+        """the fields as a plain dict, the way Task() takes them"""
+        return dict((key, getattr(self, key)) for key in self.__slots__
+                    if hasattr(self, key))
+
+
+def split_tags(tags):
+    """the tags of a task, as a list, from its "tags" string"""
+    try:
+        return shlex.split(tags or "")
+    except ValueError:
+        return (tags or "").replace('"', "").split()
+
+def translate_day(tokens):
+    """Pull a day off the front of tokens (a split-up query path) as
+    YYYY-MM-DD: today, tomorrow, yesterday, YYYY-MM-DD or YYYY/MM/DD.
+    Returns None (and leaves tokens alone) for anything else."""
+    relative = dict(yesterday=-1, today=0, tomorrow=1)
+    if tokens[0] in relative:
+        return str(datetime.date.today()
+                   + datetime.timedelta(days=relative[tokens.pop(0)]))
+    if re.match(r"^\d{4}-\d\d-\d\d$", tokens[0]):
+        return tokens.pop(0)
+    if len(tokens) >= 3 and re.match(r"^\d{4}/\d\d?/\d\d?$", "/".join(tokens[:3])):
+        day = datetime.date(*[int(tokens.pop(0)) for i in range(3)])
+        return str(day)
+    return None
+
+def translate_filters(filters, me=None):
+    """Turn the filter part of a query path (tag/x/due/before/today...)
+    into an SQL condition on the task index and its parameters; None if
+    there's something in it the index can't answer"""
+    tokens = [i for i in filters.split("/") if i]
+    where = []
+    params = []
+    while tokens:
+        key = tokens.pop(0)
+        if not tokens:
+            return None
+        if key == "tag":
+            where.append("id IN (SELECT id FROM tags WHERE base = tasks.base AND tag = ?)")
+            params.append(tokens.pop(0).lower())
+        elif key == "due":
+            op = "="
+            if tokens[0] in ("before", "after") and len(tokens) > 1:
+                op = dict(before="<", after=">")[tokens.pop(0)]
+            day = translate_day(tokens)
+            if day is None:
+                return None
+            where.append("due %s ?" % op)
+            params.append(day)
+        elif key == "priority":
+            value = tokens.pop(0)
+            value = hm_priorities.get(value, value)
+            if not str(value).isdigit():
+                return None
+            where.append("priority = ?")
+            params.append(int(value))
+        elif key == "group" and tokens[0].isdigit():
+            where.append("group_id = ?")
+            params.append(int(tokens.pop(0)))
+        elif key == "owner":
+            owner = tokens.pop(0)
+            if owner == "me":
+                if not me:
+                    return None
+                owner = me
+            where.append("owner LIKE ?")
+            params.append("%" + owner + "%")
+        elif key == "id":
+            try:
+                params.append(decode_locator(tokens.pop(0)))
+            except ValueError:
+                return None
+            where.append("id = ?")
+        else:
+            return None
+    return " AND ".join(where) or "1", params
+
+class hm_index:
+    """Local SQLite mirror of task lists, so list filters don't have to
+    go back to the server every time.  Each base query (what list or
+    listall ask for before any filters) is mirrored whole, indexed by id,
+    due date, tag, group, priority and owner, and downloaded again once
+    it's older than maxage.  invalidate() marks tasks that have been
+    written to, and just those are fetched again."""
+    def __init__(self, path, maxage=5*60, offline=False):
+        self.path = os.path.expanduser(path)
+        self.maxage = maxage
+        self.offline = offline
+        # it's a copy of your tasks, so keep it as private as the config
+        old_umask = os.umask(0077)
+        try:
+            self.db = sqlite3.connect(self.path)
+        finally:
+            os.umask(old_umask)
+        if os.stat(self.path).st_mode & (stat.S_IROTH | stat.S_IRGRP):
+            os.chmod(self.path, 0600)
+        self.db.text_factory = str
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                base TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                due TEXT,
+                priority INTEGER,
+                owner TEXT,
+                group_id INTEGER,
+                fields BLOB NOT NULL,
+                PRIMARY KEY (base, id));
+            CREATE INDEX IF NOT EXISTS tasks_id ON tasks (id);
+            CREATE INDEX IF NOT EXISTS tasks_due ON tasks (base, due);
+            CREATE INDEX IF NOT EXISTS tasks_priority ON tasks (base, priority);
+            CREATE INDEX IF NOT EXISTS tasks_owner ON tasks (base, owner);
+            CREATE INDEX IF NOT EXISTS tasks_group ON tasks (base, group_id);
+            CREATE TABLE IF NOT EXISTS tags (
+                base TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                tag TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS tags_tag ON tags (base, tag);
+            CREATE INDEX IF NOT EXISTS tags_id ON tags (base, id);
+            CREATE TABLE IF NOT EXISTS mirrors (
+                base TEXT PRIMARY KEY,
+                fetched REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS dirty (
+                base TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                PRIMARY KEY (base, id));
+        """)
+        self.db.commit()
+
+    def query(self, hm, base, filters="", me=None, refresh=False):
+        """The tasks of base (a query path) matching filters (more query
+        path), in the order the server gave them; None if the filters
+        are beyond the index.  Syncs base through hm (an hm_talker)
+        first, unless offline."""
+        translated = translate_filters(filters, me)
+        if translated is None:
+            return None
+        where, params = translated
+        self.sync(hm, base, refresh)
+        rows = self.db.execute("SELECT fields FROM tasks WHERE base = ? AND %s "
+                               "ORDER BY position" % where, [base] + params)
+        return [Task(cPickle.loads(str(fields))) for (fields,) in rows]
+
+    def lookup(self, task_id, filters="", me=None):
+        """The task with id task_id (a number), if it matches filters, from
+        any up-to-date mirror: [task], [] if it doesn't match, or None if
+        no mirror has it (or the filters are beyond the index)"""
+        translated = translate_filters(filters, me)
+        if translated is None:
+            return None
+        where, params = translated
+        rows = self.db.execute("""
+            SELECT fields, %s FROM tasks JOIN mirrors USING (base)
+            WHERE id = ? AND (fetched >= ? OR ?)
+            AND NOT EXISTS (SELECT 1 FROM dirty
+                            WHERE dirty.base = tasks.base AND dirty.id = tasks.id)
+            LIMIT 1""" % where,
+            params + [task_id, time.time() - self.maxage, self.offline]).fetchall()
+        if not rows:
+            return None
+        fields, matched = rows[0]
+        return matched and [Task(cPickle.loads(str(fields)))] or []
+
+    def sync(self, hm, base, refresh=False):
+        """Bring the mirror of base up to date: all of it if it's missing
+        or stale, otherwise just the tasks marked dirty"""
+        row = self.db.execute("SELECT fetched FROM mirrors WHERE base = ?",
+                              (base,)).fetchone()
+        if self.offline:
+            if row is None:
+                raise Exception("no local copy of %s to work offline from" % base)
+            return
+        if refresh or row is None or row[0] + self.maxage < time.time():
+            self.db.execute("DELETE FROM tasks WHERE base = ?", (base,))
+            self.db.execute("DELETE FROM tags WHERE base = ?", (base,))
+            self.db.execute("DELETE FROM dirty WHERE base = ?", (base,))
+            for position, task in enumerate(hm.download_tasks(base)):
+                self.store(base, position, task)
+            self.db.execute("INSERT OR REPLACE INTO mirrors (base, fetched) "
+                            "VALUES (?, ?)", (base, time.time()))
+            self.db.commit()
+            return
+
+        dirty = [i for (i,) in self.db.execute("SELECT id FROM dirty WHERE base = ?", (base,))]
+        if not dirty:
+            return
+        queries = ["%s/id/%s" % (base, encode_locator(i)) for i in dirty]
+        for task_id, found in zip(dirty, hm.download_tasks_many(queries)):
+            row = self.db.execute("SELECT position FROM tasks WHERE base = ? AND id = ?",
+                                  (base, task_id)).fetchone()
+            if row is None:
+                row = self.db.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM tasks "
+                                      "WHERE base = ?", (base,)).fetchone()
+            self.forget(base, task_id)
+            for task in found:
+                self.store(base, row[0], task)
+        self.db.execute("DELETE FROM dirty WHERE base = ?", (base,))
+        self.db.commit()
+
+    def store(self, base, position, task):
+        due = task.get("due")
+        if due:
+            due = str(due)[:10]
+        group = task.get("group_id")
+        self.db.execute("INSERT OR REPLACE INTO tasks (base, id, position, due, "
+                        "priority, owner, group_id, fields) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (base, int(task["id"]), position, due or None,
+                         task.get("priority"), str(task.get("owner", "")),
+                         group and int(group) or None,
+                         sqlite3.Binary(cPickle.dumps(task.fields(), cPickle.HIGHEST_PROTOCOL))))
+        self.db.executemany("INSERT INTO tags (base, id, tag) VALUES (?, ?, ?)",
+                            [(base, int(task["id"]), tag.lower())
+                             for tag in split_tags(task.get("tags"))])
+
+    def forget(self, base, task_id):
+        self.db.execute("DELETE FROM tasks WHERE base = ? AND id = ?", (base, task_id))
+        self.db.execute("DELETE FROM tags WHERE base = ? AND id = ?", (base, task_id))
+
+    def invalidate(self, task_ids=None):
+        """Note that the tasks with ids task_ids (numbers) have changed, so
+        they're fetched again next time; with no ids, everything is"""
+        if task_ids is None:
+            self.db.execute("DELETE FROM mirrors")
+        else:
+            for task_id in task_ids:
+                self.db.execute("INSERT OR IGNORE INTO dirty (base, id) "
+                                "SELECT base, ? FROM mirrors", (task_id,))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
 
+class UsageError(Exception):
+    """a subcommand was given the wrong arguments"""
 
 # generic sub-command argument handler
 class subcommands:
@@ -439,6 +1017,43 @@ class subcommands:
 def join_tags(tags):
     return " ".join('"%s"' % tag for tag in tags)
 
+def split_task_ids(args):
+    """task ids given on the command line, separately or comma-separated,
+    as numbers"""
+    return [decode_locator(locator) for arg in args
+            for locator in arg.split(",") if locator]
+
+def format_task_line(task):
+    """the one-line "* summary (id) [tags]" rendering of a task"""
+    return "    * %s (%s) [%s]" % (task["summary"], encode_locator(task["id"]), task["tags"])
+
+def format_task_list(tasks):
+    """render tasks the way "todo.py list" prints them, grouped by owner
+    and priority; returns a list of lines so it can be used in-process"""
+    out = []
+    for owner, my_tasks in itertools.groupby(tasks, operator.itemgetter("owner")):
+        out.append("%s:" % owner)
+        for prio, my_pri_tasks in itertools.groupby(my_tasks, operator.itemgetter("priority")):
+            out.append("  %s priority:" % hm_priority_names[prio])
+            for task in my_pri_tasks:
+                out.append(format_task_line(task))
+                if task["description"]:
+                    out.append("     - " + task["description"].encode("ascii","replace").rstrip().replace("\n","\n        "))
+                #print dir(task)
+                #print task
+                # TODO: protocol doesn't *have* last_repeat anymore,
+                #  instead has 'repeat_every': 1, 'repeat_period': 'once', 'repeat_next_create': None,
+                #  'repeat_stacking': 0, 'repeat_days_before_due': 1 (example values)
+                if "last_repeat" in task:
+                    subtask = task["last_repeat"]["values"]
+                    if int(subtask["depends_on_count"]):
+                        out.append("     -> %s %s %s" % (subtask["depends_on_count"], subtask["depends_on_ids"], subtask["depends_on_summaries"]))
+                        out.append("     -> %s %s %s" % (subtask["depends_on_count"], encode_locator(subtask["depends_on_ids"]), subtask["depends_on_summaries"]))
+                    if int(subtask["depended_on_by_count"]):
+                        out.append("     -> %s %s %s" % (subtask["depended_on_by_count"], subtask["depended_on_by_ids"], subtask["depended_on_by_summaries"]))
+                        out.append("     -> %s %s %s" % (subtask["depended_on_by_count"], encode_locator(subtask["depended_on_by_ids"]), subtask["depended_on_by_summaries"]))
+    return out
+
 # feature set:
 class hm_subcommands(subcommands):
     """todo.pl-compatible subcommands"""
@@ -454,6 +1069,14 @@ class hm_subcommands(subcommands):
                 del args[k]
         return args
 
+    def invalidate(self, task_ids=None):
+        """tell the local task index (if any) what's about to be written
+        to; done before the write, so one that fails partway still leaves
+        the tasks it did change marked"""
+        index = getattr(self, "index", None)
+        if index:
+            index.invalidate(task_ids)
+
     def handle_response(self, resp, success_msg):
         """handle XML response. of course, it's already been tested..."""
         if resp:
@@ -469,41 +1092,64 @@ class hm_subcommands(subcommands):
         else:
             raise Exception("Failed to %s: %s" % (success_msg, resp.find("error").text))
 
+    def handle_responses(self, results, task_ids, success_msg):
+        """handle the responses to a bulk change, one per task id;
+        success_msg has a %s for the task.  Reports every failure, then
+        exits if there were any."""
+        if len(task_ids) == 1:
+            ok, resp = results[0]
+            return self.handle_response(resp, success_msg % encode_locator(task_ids[0]))
+        failures = []
+        for task_id, (ok, resp) in zip(task_ids, results):
+            locator = encode_locator(task_id)
+            if ok:
+                print success_msg % locator
+            elif resp is not None and resp.find("error") is not None:
+                failures.append("%s: %s" % (locator, resp.find("error").text))
+            else:
+                failures.append("%s: no response" % locator)
+        if failures:
+            sys.exit("failed with:\n" + "\n".join(failures))
+
     def do_add(self, *summary):
         """create a task"""
         if not summary:
             raise UsageError("Must specify a one-line task description")
+        self.invalidate()
         ok, res = self.hm.call("CreateTask",
                                summary=" ".join(summary),
                                **self.map_general_task_args())
         self.handle_response(res, "Created task")
     def do_edit(self, task_id, summary=None):
+        self.invalidate([decode_locator(task_id)])
         ok, res = self.hm.call("UpdateTask",
                                id=decode_locator(task_id),
                                summary = summary,
                                **self.map_general_task_args())
         self.handle_response(res, "Updated task %s" % task_id)
 
-    def do_tag(self, task_id, *new_tags):
-        """add tags to an existing task"""
-        this_tasks = self.hm.download_tasks("id/%s" % task_id)
-        existing_tags = this_tasks[0]["tags"]
-        ok, res = self.hm.call("UpdateTask",
-                               id=decode_locator(task_id),
-                               tags = existing_tags + " " + join_tags(new_tags))
-        self.handle_response(res, "Added tags %s to %s" % (", ".join(new_tags), task_id))
-    def do_done(self, task_id):
-        """Mark task as done"""
-        ok, res = self.hm.call("UpdateTask",
-                               id=decode_locator(task_id),
-                               complete=1)
-        self.handle_response(res, "Completed task %s" % task_id)
+    def do_tag(self, task_ids, *new_tags):
+        """add tags to existing tasks (ids comma-separated)"""
+        task_ids = split_task_ids([task_ids])
+        self.invalidate(task_ids)
+        # read the tags fresh, not from the index, or anything tagged
+        # since it was synced would be written over
+        results = self.hm.tag_tasks(task_ids, new_tags)
+        self.handle_responses(results, task_ids,
+                              "Added tags %s to %%s" % ", ".join(new_tags))
+    def do_done(self, *task_ids):
+        """Mark tasks as done"""
+        task_ids = split_task_ids(task_ids)
+        self.invalidate(task_ids)
+        results = self.hm.update_tasks(task_ids, complete=1)
+        self.handle_responses(results, task_ids, "Completed task %s")
     do_do = do_done
-    def do_del(self, task_id):
-        """Delete task by id"""
-        ok, res = self.hm.call("DeleteTask",
-                               id=decode_locator(task_id))
-        self.handle_response(res, "Deleted task %s" % task_id)
+    def do_del(self, *task_ids):
+        """Delete tasks by id"""
+        task_ids = split_task_ids(task_ids)
+        self.invalidate(task_ids)
+        results = self.hm.delete_tasks(task_ids)
+        self.handle_responses(results, task_ids, "Deleted task %s")
     do_rm = do_del
     def do_pending(self):
         pass
@@ -515,10 +1161,15 @@ class hm_subcommands(subcommands):
         pass
     def do_requests(self):
         pass
-    def do_hide(self, task_id, date):
-        """Hide a task until date"""
-        ok, res = self.hm.call("UpdateTask", id=decode_locator(task_id), starts=date)
-        self.handle_response(res, "Hid task %s until %s" % (task_id, date))
+    def do_hide(self, *args):
+        """Hide tasks until date (the last argument)"""
+        if len(args) < 2:
+            raise UsageError("hide <task-id>... <date>")
+        date = args[-1]
+        task_ids = split_task_ids(args[:-1])
+        self.invalidate(task_ids)
+        results = self.hm.update_tasks(task_ids, starts=date)
+        self.handle_responses(results, task_ids, "Hid task %%s until %s" % date)
     def do_comment(self, task_id):
         """Add a comment to a task"""
         lines = []
@@ -532,6 +1183,7 @@ class hm_subcommands(subcommands):
             lines.append(s.strip())
 
         comment = "<br />\n".join(lines)
+        self.invalidate([decode_locator(task_id)])
         ok, res = self.hm.call("UpdateTask", id=decode_locator(task_id), comment=comment)
         self.handle_response(res, "Added comment to task %s" % task_id)
 
@@ -540,6 +1192,7 @@ class hm_subcommands(subcommands):
     def do_upload(self, filename):
         """upload braindump tasks from a file"""
         # for now, be lazy and let the caller catch the tracebacks from open
+        self.invalidate()
         ok, res = self.hm.call("UploadTasks", content=file(filename).read(), format='sync')
         self.handle_response(res, "Uploaded tasks from %s" % filename)
     def do_list(self):
@@ -550,45 +1203,50 @@ class hm_subcommands(subcommands):
         return self.list_engine("not/complete/starts/before/tomorrow/accepted")
     def do_listid(self, task_id):
         """List a single task by id"""
-        return self.list_engine("id/%s" % task_id)
+        return self.list_engine("id/%s" % task_id, mirrored=False)
 
-    def list_engine(self, default_query):
-        """handle listing based on query supplied"""
-        query = default_query
+    def list_engine(self, default_query, mirrored=True):
+        """handle listing based on query supplied; answered from the local
+        task index when it can be, the server otherwise"""
+        filters = ""
         if self.options.tag:
-            query = query + "".join("/tag/%s" % tag for tag in self.options.tag)
+            filters = filters + "".join("/tag/%s" % tag for tag in self.options.tag)
         for key in ["group", "priority", "due", "owner"]:
             value = getattr(self.options, key)
             if value:
-                query = query + "/%s/%s" % (key, value)
-        tasks = self.hm.download_tasks(query)
+                filters = filters + "/%s/%s" % (key, value)
+        tasks = self.indexed_tasks(default_query, filters, mirrored)
+        if tasks is None:
+            tasks = self.hm.download_tasks(default_query + filters)
         # print "TASKS:", tasks
         if self.options.task_ids_only:
             for task in tasks:
                 print encode_locator(task["id"])
             return
-        for owner, my_tasks in itertools.groupby(tasks, operator.itemgetter("owner")):
-            print "%s:" % owner
-            for prio, my_pri_tasks in itertools.groupby(my_tasks, operator.itemgetter("priority")):
-                print "  %s priority:" % hm_priority_names[prio]
-                for task in my_pri_tasks:
-                    print "    *", task["summary"], "(%s)" % encode_locator(task["id"]), "[%s]" % task["tags"]
-                    if task["description"]:
-                        print "     -", task["description"].encode("ascii","replace").rstrip().replace("\n","\n        ")
-                    #print dir(task)
-                    #print task
-                    # TODO: protocol doesn't *have* last_repeat anymore,
-                    #  instead has 'repeat_every': 1, 'repeat_period': 'once', 'repeat_next_create': None,
-                    #  'repeat_stacking': 0, 'repeat_days_before_due': 1 (example values)
-                    if "last_repeat" in task:
-                        subtask = task["last_repeat"]["values"]
-                        if int(subtask["depends_on_count"]):
-                            print "     ->", subtask["depends_on_count"], subtask["depends_on_ids"], subtask["depends_on_summaries"]
-                            print "     ->", subtask["depends_on_count"], encode_locator(subtask["depends_on_ids"]), subtask["depends_on_summaries"]
-                        if int(subtask["depended_on_by_count"]):
-                            print "     ->", subtask["depended_on_by_count"], subtask["depended_on_by_ids"], subtask["depended_on_by_summaries"]
-                            print "     ->", subtask["depended_on_by_count"], encode_locator(subtask["depended_on_by_ids"]), subtask["depended_on_by_summaries"]
-
+        for line in format_task_list(tasks):
+            print line
+
+
+    def indexed_tasks(self, base, filters, mirrored=True):
+        """the tasks for base + filters from the local task index, or None
+        if it can't say"""
+        index = getattr(self, "index", None)
+        if not index:
+            return None
+        if mirrored:
+            return index.query(self.hm, base, filters,
+                               me=self.conf.config.get("email"),
+                               refresh=self.options.refresh)
+        # a single task, from whichever list has it
+        match = re.match(r"^id/(\w+)$", base)
+        if match and not self.options.refresh:
+            tasks = index.lookup(decode_locator(match.group(1)), filters,
+                                 me=self.conf.config.get("email"))
+            if tasks is not None:
+                return tasks
+        if index.offline:
+            raise Exception("%s isn't in the local task index" % base)
+        return None
 
     #def do_reconfig(self):
     #    pass
@@ -598,6 +1256,7 @@ class hm_subcommands(subcommands):
         print self.hm.altcall(query)
     def do_but_first(self, task_id, depends_on):
         """task_id but-first depends_on"""
+        self.invalidate([decode_locator(task_id), decode_locator(depends_on)])
         ok, res = self.hm.call("CreateTaskDependency",
                                task_id=decode_locator(task_id),
                                depends_on=decode_locator(depends_on))
@@ -607,6 +1266,8 @@ class hm_subcommands(subcommands):
 
 if __name__ == "__main__":
 
+    check_locators()
+
     # global options
     parser = optparse.OptionParser(usage=usage)
     parser.disable_interspersed_args()
@@ -622,6 +1283,12 @@ if __name__ == "__main__":
     parser.add_option("--config")
     parser.add_option("--reconfig", action="store_true")
     parser.add_option("--debug-protocol", action="store_true")
+    parser.add_option("--offline", action="store_true",
+                      help="Answer lists from the local task index only")
+    parser.add_option("--refresh", action="store_true",
+                      help="Download lists again even if the local copy is fresh")
+    parser.add_option("--no-index", action="store_true",
+                      help="Don't keep a local index of tasks")
     options, args = parser.parse_args()
     
     subcmds = hm_subcommands()
@@ -630,14 +1297,22 @@ if __name__ == "__main__":
     conf = hm_config(options.config)
     hm = hm_talker(conf, debug=options.debug_protocol)
 
-    subcmds = hm_subcommands(conf=conf, hm=hm, options=options)
+    index = None
+    if not options.no_index:
+        index = hm_index(conf.conffile + ".tasks", offline=options.offline)
+
+    subcmds = hm_subcommands(conf=conf, hm=hm, options=options, index=index)
 
-    if options.reconfig or not conf.configured():
-        conf.new_config(hm.do_login)
+    if options.offline:
+        if not index:
+            sys.exit("--offline needs the local task index")
+    else:
+        if options.reconfig or not conf.configured():
+            conf.new_config(hm.do_login)
 
-    if not hm.do_login():
-        # use reconfig?
-        sys.exit("Bad username/password; %s --reconfig and try again." % __file__)
+        if not hm.do_login():
+            # use reconfig?
+            sys.exit("Bad username/password; %s --reconfig and try again." % __file__)
 
     # hack to map priority into names while accepting numbers
     options.priority = hm_priorities.get(options.priority, options.priority)